@@ -0,0 +1,19 @@
+import os
+from pathlib import Path
+
+# Настройки читаются при импорте src.settings; если .env нет,
+# подставляем заглушки, чтобы модули импортировались в тестах
+if not (Path(__file__).resolve().parent / '.env').exists():
+    for _name, _value in {
+        'IMAP_EMAIL': 'test@example.com',
+        'IMAP_PASSWORD': 'test',
+        'AMO_LONG_TERM_TOKEN': 'test',
+        'AMO_SUBDOMAIN': 'test',
+        'DB_USER': 'test',
+        'DB_PASSWORD': 'test',
+        'DB_NAME': 'test',
+        'DB_HOST': 'localhost',
+        'DB_PORT': '5432',
+        'MODE': 'test',
+    }.items():
+        os.environ.setdefault(_name, _value)
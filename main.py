@@ -11,7 +11,7 @@ if sys.platform == "win32":
 
 from src.amo.client import AmoClient
 from src.db import PostgresDB
-from src.mail.file_parser import ExcelParser
+from src.mail.file_parser import ExcelParser, shutdown_process_pool
 from src.mail.mail_connector import Gmail
 from src.settings import settings
 
@@ -48,7 +48,8 @@ async def main():
         while True:
             logger.info("Проверка новых писем...")
             try:
-                file_content, file_name = gmail_client.get_most_recent_file()
+                most_recent_file = await asyncio.to_thread(gmail_client.get_most_recent_file)
+                file_content, file_name = most_recent_file if most_recent_file else (None, None)
                 
                 if file_content and file_name:
                     logger.info(f"Обнаружен файл в почте: {file_name}")
@@ -65,11 +66,14 @@ async def main():
                         logger.info(f"Новый файл: '{file_name}' (дата выгрузки: {current_file_extraction_dt}, предыдущая обработка: {last_processed_extraction_dt}).")
                     else:
                         logger.info(f"Файл '{file_name}' (дата выгрузки: {current_file_extraction_dt}) не новее последнего обработанного ({last_processed_extraction_dt}). Пропуск.")
+                        gmail_client.mark_processed()
 
                     if process_this_file:
                         logger.info(f"Начало обработки файла: {file_name}")
               
                         parsed_data_for_db = await parser.parse_for_db()
+                        # Исходный файл больше не нужен: освобождаем байты книги до записи в БД и AmoCRM
+                        del parser, file_content, most_recent_file
 
                         if parsed_data_for_db:
                             async with PostgresDB() as db:
@@ -85,6 +89,7 @@ async def main():
                             logger.warning(f"Нет данных для обработки в AmoCRM из файла '{file_name}'.")
                   
                         last_processed_extraction_dt = current_file_extraction_dt
+                        gmail_client.mark_processed()
                         logger.info(f"Файл '{file_name}' успешно обработан. Дата последней обработки обновлена на: {last_processed_extraction_dt}")
                 else:
                     logger.info("Новых файлов Excel в почте не найдено.")
@@ -110,6 +115,7 @@ async def main():
         logger.info("Главная задача была отменена.")
     finally:
         logger.info("Приложение завершает работу.")
+        shutdown_process_pool()
         if 'gmail_client' in locals() and hasattr(gmail_client.imap, 'state') and gmail_client.imap.state == 'SELECTED':
             try:
                 gmail_client.imap.close()
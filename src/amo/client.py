@@ -1,28 +1,58 @@
+import asyncio
+import contextlib
+import copy
+import gzip
+import json
 import logging
-from typing import Self, Optional, List, Dict, Any
+import random
+import sys
+import time
+from collections import OrderedDict
+from typing import Self, Optional, List, Dict, Any, AsyncIterator, Tuple, Iterable, NamedTuple
 
-from aiohttp import ClientSession, ClientResponseError
-from aiolimiter import AsyncLimiter
+from aiohttp import ClientSession, ClientConnectionError, ClientResponseError, ClientTimeout, TCPConnector
 
+from src.amo.rate_limit import TokenBucket
 from src.settings import settings
 
 logger = logging.getLogger(__name__)
 
 
+class LeadContext(NamedTuple):
+    """Набор ID, необходимых для создания сделок в конкретной воронке и статусе."""
+    pipeline_id: Optional[int]
+    status_id: Optional[int]
+    user_ids: Dict[str, Optional[int]]
+    custom_field_ids: Dict[str, int]
+
+
 class AmoClient:
     """
     Клиент для взаимодействия с API amoCRM.
 
     """
     _session: ClientSession
+    _connector: TCPConnector
     _API_VERSION = "v4"
-
-    pipelines_ids: Dict[str, int]
-    statuses_ids: Dict[int, Dict[str, int]]
-    users_ids: Dict[str, int]
-    custom_fields_lead_ids: Dict[str, int]
-    custom_fields_company_ids: Dict[str, int]
-    task_types_ids: Dict[str, int]
+    _ENDPOINTS = (
+        '/leads', '/leads/pipelines', '/leads/custom_fields', '/leads/notes',
+        '/companies', '/companies/custom_fields', '/users', '/tasks',
+    )
+    _GZIP_MIN_ITEMS = 20
+    _BATCH_SIZE = 250
+    _GZIP_MIN_BYTES = 16 * 1024
+    _INN_CACHE_MAX_SIZE = 1024
+    _MAX_INFLIGHT_REQUESTS = 16
+    _MAX_RETRIES = 4
+    _RETRY_BASE_DELAY = 0.5
+    _RETRY_MAX_DELAY = 30.0
+    _RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+    # Повтор после ошибки сервера или обрыва соединения безопасен только для запросов,
+    # повторное выполнение которых не создаст дубликаты
+    _IDEMPOTENT_METHODS = frozenset({'GET', 'PATCH'})
+    # Справочники ID общие для всех экземпляров клиента одного аккаунта:
+    # base_url -> (срок действия по time.monotonic(), снимок справочников)
+    _ids_cache: Dict[str, Tuple[float, Tuple[Any, ...]]] = {}
 
     def __init__(self):
         self._headers = {
@@ -30,26 +60,47 @@ class AmoClient:
             'Content-Type': 'application/json'
         }
         self._base_url = f"https://{settings.current_amo_subdomain}.amocrm.ru/api/{self._API_VERSION}"
-        rate = 1.0 / settings.request_delay if settings.request_delay > 0 else 2.0
-        self._rate_limit = AsyncLimiter(max_rate=rate, time_period=1)
+        self._urls = {endpoint: self._base_url + endpoint for endpoint in self._ENDPOINTS}
+        rate = settings.amo_rate_limit if settings.amo_rate_limit > 0 else 2.0
+        self._rate_limit = TokenBucket(rate=rate, capacity=max(settings.amo_rate_burst, 1))
         self._initialized_ids = False
-
-        self.pipelines_ids = {}
-        self.statuses_ids = {}
-        self.users_ids = {}
-        self.custom_fields_lead_ids = {}
-        self.custom_fields_company_ids = {}
-        self.task_types_ids = {}
+        self._gzip_requests = True
+        self._inflight = asyncio.Semaphore(self._MAX_INFLIGHT_REQUESTS)
+
+        self.pipelines_ids: Dict[str, int] = {}
+        self.statuses_ids: Dict[int, Dict[str, int]] = {}
+        self.users_ids: Dict[str, int] = {}
+        self.custom_fields_lead_ids: Dict[str, int] = {}
+        self.custom_fields_company_ids: Dict[str, int] = {}
+        self.task_types_ids: Dict[str, int] = {}
+        self._status_by_names: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._inn_cache: OrderedDict[str, Tuple[float, List[Dict[str, Any]]]] = OrderedDict()
+        self._inn_inflight: Dict[str, asyncio.Future] = {}
+        # Номер "поколения" ИНН растет при создании компании: результат поиска, начатого
+        # до создания, уже устарел и не попадает в кэш
+        self._inn_generations: Dict[str, int] = {}
 
 
     async def __aenter__(self) -> Self:
         """
         Входит в асинхронный контекст.
-        Создает сессию aiohttp и выполняет инициализацию справочников ID.
+        Создает сессию aiohttp с пулом keep-alive соединений и выполняет
+        инициализацию справочников ID.
         Returns:
             Экземпляр клиента AmoClient.
         """
-        self._session = ClientSession(headers=self._headers, trust_env=True)
+        self._connector = TCPConnector(
+            limit=32,
+            limit_per_host=self._MAX_INFLIGHT_REQUESTS,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        self._session = ClientSession(
+            connector=self._connector,
+            headers=self._headers,
+            trust_env=True,
+            timeout=ClientTimeout(total=30, connect=5),
+        )
         await self._ensure_ids_initialized()
         return self
 
@@ -60,38 +111,122 @@ class AmoClient:
         """
         if self._session and not self._session.closed:
             await self._session.close()
+        if not self._connector.closed:
+            await self._connector.close()
 
 
-    async def _request(self, method: str, url: str, json_data: Optional[Dict[str, Any]] = None,
-                       params: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    async def _request(self, method: str, url: str, json_data: Optional[Dict[str, Any] | List[Dict[str, Any]]] = None,
+                       params: Optional[Dict[str, Any] | List[Tuple[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """
-        Выполняет асинхронный HTTP-запрос к API.
+        Выполняет асинхронный HTTP-запрос к API, повторяя его при временных ошибках:
+        429 - для любых запросов, 5xx и сетевые ошибки - только для GET и PATCH.
+        Паузы между попытками растут экспоненциально (со случайным разбросом).
         Args:
             method: HTTP-метод запроса.
             url: Часть URL-пути после базового URL.
-            json_data: Словарь с данными для отправки в теле запроса в формате JSON.
-            params: Словарь с параметрами для добавления к URL в виде query string.
+            json_data: Данные для отправки в теле запроса в формате JSON.
+            params: Параметры для добавления к URL в виде query string.
+        Returns:
+            Словарь с JSON-ответом от сервера или None для ответа без тела.
+            После исчерпания попыток вызывает последнее исключение повторно.
+        """
+        for attempt in range(self._MAX_RETRIES + 1):
+            try:
+                return await self._send_request(method, url, json_data=json_data, params=params)
+            except (ClientResponseError, ClientConnectionError, asyncio.TimeoutError) as e:
+                delay = self._get_retry_delay(method, e, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"Повтор запроса {method} {url} через {delay:.1f} с (попытка {attempt + 2} из {self._MAX_RETRIES + 1}): {e!r}")
+                await asyncio.sleep(delay)
+
+
+    def _get_retry_delay(self, method: str, error: Exception, attempt: int) -> Optional[float]:
+        """
+        Args:
+            method: HTTP-метод запроса.
+            error: Исключение, которым завершилась попытка.
+            attempt: Номер неудачной попытки (с нуля).
+        Returns:
+            Пауза перед следующей попыткой в секундах или None, если запрос не повторяется.
+        """
+        if attempt >= self._MAX_RETRIES:
+            return None
+        if isinstance(error, ClientResponseError):
+            if error.status != 429 and (error.status not in self._RETRYABLE_STATUSES or method not in self._IDEMPOTENT_METHODS):
+                return None
+        elif method not in self._IDEMPOTENT_METHODS:
+            return None
+        # При 429 ожидание из Retry-After уже заложено в ограничитель частоты (penalize)
+        return min(self._RETRY_MAX_DELAY, self._RETRY_BASE_DELAY * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+        """
+        Args:
+            value: Значение заголовка Retry-After (число секунд).
+            default: Пауза, если заголовка нет или он не распознан.
+        Returns:
+            Пауза в секундах.
+        """
+        try:
+            return max(float(value), 0.0) if value else default
+        except ValueError:
+            return default
+
+
+    async def _send_request(self, method: str, url: str, json_data: Optional[Dict[str, Any] | List[Dict[str, Any]]] = None,
+                            params: Optional[Dict[str, Any] | List[Tuple[str, Any]]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Выполняет одну попытку HTTP-запроса к API.
+        Args:
+            method: HTTP-метод запроса.
+            url: Часть URL-пути после базового URL.
+            json_data: Данные для отправки в теле запроса в формате JSON.
+                       Крупные тела запросов сжимаются gzip.
+            params: Параметры для добавления к URL в виде query string
+                    (словарь или список пар ключ-значение).
         Returns:
             В случае успешного выполнения запроса (статус 2xx, кроме 204)
             возвращает словарь с JSON-ответом от сервера.
             В случае ошибки (статус 4xx или 5xx) или другого исключения,
             логирует ошибку и вызывает исключение повторно.
         """
-        full_url = f"{self._base_url}{url}"
-        async with self._rate_limit:
+        full_url = self._urls.get(url) or f"{self._base_url}{url}"
+        compressed = False
+        async with self._inflight:
+            await self._rate_limit.acquire()
             try:
                 kwargs = {}
                 if json_data:
-                    kwargs['json'] = json_data
+                    body = json.dumps(json_data, ensure_ascii=False, separators=(',', ':')).encode()
+                    compressed = self._gzip_requests and (
+                        (isinstance(json_data, list) and len(json_data) > self._GZIP_MIN_ITEMS)
+                        or len(body) > self._GZIP_MIN_BYTES
+                    )
+                    if compressed:
+                        kwargs['data'] = gzip.compress(body, compresslevel=1)
+                        kwargs['headers'] = {'Content-Encoding': 'gzip', 'Content-Type': 'application/json'}
+                    else:
+                        kwargs['data'] = body
+                        kwargs['headers'] = {'Content-Type': 'application/json'}
                 if params:
                     kwargs['params'] = params
-                logger.debug(f"AmoAPI Request: {method} {full_url} | Params: {params} | JSON: {json_data is not None}")
+                logger.debug(f"AmoAPI Request: {method} {full_url} | Params: {params} | JSON: {json_data is not None} | gzip: {compressed}")
                 async with self._session.request(method, full_url, **kwargs) as response:
                     logger.debug(f"AmoAPI Response Status: {response.status} for {full_url}")
                     if 200 <= response.status < 300:
                         if response.status == 204:
                             return None
-                        return await response.json()
+                        return json.loads(await response.read())
+                    elif response.status == 429:
+                        logger.warning(f"amoCRM вернул 429 для {method} {full_url}. Приостанавливаем отправку запросов.")
+                        self._rate_limit.penalize(self._parse_retry_after(response.headers.get('Retry-After')))
+                        response.raise_for_status()
+                    elif response.status == 415 and compressed:
+                        logger.warning("amoCRM отклонил сжатое тело запроса (415). Отключаем gzip и повторяем запрос без сжатия.")
+                        self._gzip_requests = False
                     else:
                         response_text = await response.text()
                         logger.error(
@@ -104,9 +239,107 @@ class AmoClient:
             except Exception as e:
                 logger.error(f"Unexpected error during request to {full_url}: {e}", exc_info=True)
                 raise
+        if compressed and not self._gzip_requests:
+            return await self._send_request(method, url, json_data=json_data, params=params)
         return None
 
 
+    async def _iter_all_pages(
+        self,
+        endpoint: str,
+        entity_key_in_embedded: str,
+        params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Постранично обходит эндпоинт и отдает сущности по мере получения страниц.
+        Вызывающий код может обработать и отбросить сущности страницы до загрузки
+        следующей, не удерживая в памяти весь результат. Запрос следующей страницы
+        отправляется сразу после получения текущей, пока она обрабатывается.
+        Args:
+            endpoint: Эндпоинт API (например, '/leads').
+            entity_key_in_embedded: Ключ в словаре '_embedded' ответа,
+                                    содержащий список сущностей (например, 'leads').
+            params: Дополнительные параметры запроса.
+        Yields:
+            Словари, представляющие сущности.
+        """
+        page = 1
+        total = 0
+        base_params = self._to_query_pairs(params)
+        pending = asyncio.create_task(self._fetch_page(endpoint, base_params, page))
+        try:
+            while pending:
+                try:
+                    response = await pending
+                except Exception:
+                    logger.error(f"API error or unexpected error fetching page {page} for {endpoint}. Stopping pagination.", exc_info=True)
+                    break
+                pending = None
+
+                if not response or '_embedded' not in response or entity_key_in_embedded not in response['_embedded']:
+                    if page == 1 and response and '_embedded' in response and not response['_embedded'].get(entity_key_in_embedded):
+                        logger.debug(f"No entities '{entity_key_in_embedded}' found on first page for {endpoint}.")
+                    break
+
+                entities = response['_embedded'][entity_key_in_embedded]
+                has_next = bool(response.get('_links', {}).get('next'))
+                del response
+                if not isinstance(entities, list):
+                    if not entities:
+                        break
+                    entities = [entities]
+                elif not entities:
+                    break
+
+                if has_next:
+                    page += 1
+                    pending = asyncio.create_task(self._fetch_page(endpoint, base_params, page))
+
+                total += len(entities)
+                for entity in entities:
+                    yield entity
+        finally:
+            if pending:
+                if not pending.done():
+                    pending.cancel()
+                elif not pending.cancelled():
+                    pending.exception()
+        logger.debug(f"Fetched {total} items for '{entity_key_in_embedded}' from {endpoint}")
+
+
+    @staticmethod
+    def _to_query_pairs(params: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, Any], ...]:
+        """
+        Преобразует параметры запроса в кортеж пар ключ-значение.
+        Списки и кортежи разворачиваются в повторяющиеся ключи
+        (например, filter[note_type]=a&filter[note_type]=b).
+        Args:
+            params: Словарь параметров запроса.
+        Returns:
+            Кортеж пар ключ-значение.
+        """
+        if not params:
+            return ()
+        return tuple(
+            (key, item)
+            for key, value in params.items()
+            for item in (value if isinstance(value, (list, tuple)) else (value,))
+        )
+
+
+    async def _fetch_page(self, endpoint: str, base_params: Tuple[Tuple[str, Any], ...], page: int) -> Optional[Dict[str, Any]]:
+        """
+        Запрашивает одну страницу списка сущностей.
+        Args:
+            endpoint: Эндпоинт API.
+            base_params: Общие для всех страниц параметры запроса в виде пар ключ-значение.
+            page: Номер страницы.
+        Returns:
+            JSON-ответ страницы или None.
+        """
+        return await self._request('GET', endpoint, params=[*base_params, ('page', page), ('limit', 250)])
+
+
     async def _get_all_pages(self, endpoint: str, entity_key_in_embedded: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Собирает данные со всех страниц с учетом пагинации.
@@ -118,40 +351,50 @@ class AmoClient:
         Returns:
             Список словарей, представляющих все сущности, полученные со всех страниц.
         """
-        all_data: List[Dict[str, Any]] = []
-        page = 1
-        while True:
-            current_params = params.copy() if params else {}
-            current_params['page'] = page
-            current_params['limit'] = 250
-            try:
-                response = await self._request('GET', endpoint, params=current_params)
-            except Exception:
-                logger.error(f"API error or unexpected error fetching page {page} for {endpoint}. Stopping pagination.", exc_info=True)
-                break
-
-            if not response or '_embedded' not in response or entity_key_in_embedded not in response['_embedded']:
-                if page == 1 and response and '_embedded' in response and not response['_embedded'].get(entity_key_in_embedded):
-                    logger.debug(f"No entities '{entity_key_in_embedded}' found on first page for {endpoint}.")
-                break
-
-            entities = response['_embedded'][entity_key_in_embedded]
-            if not isinstance(entities, list):
-                if entities:
-                    all_data.append(entities)
-                else:
-                    break
-            else:
-                if not entities:
-                    break
-                all_data.extend(entities)
+        return [entity async for entity in self._iter_all_pages(endpoint, entity_key_in_embedded, params)]
+
+
+    @staticmethod
+    def _has_custom_field_value(entity: Dict[str, Any], field_id: int, value: Any) -> bool:
+        """
+        Проверяет, содержит ли пользовательское поле сущности указанное значение.
+        Args:
+            entity: Словарь сущности (сделки, компании) из ответа API.
+            field_id: ID пользовательского поля.
+            value: Искомое значение.
+        Returns:
+            True, если значение найдено в поле, иначе False.
+        """
+        target = next(
+            (cf_value for cf_value in entity.get('custom_fields_values') or () if cf_value['field_id'] == field_id),
+            None
+        )
+        return target is not None and any(v.get('value') == value for v in target.get('values') or ())
 
-            if response.get('_links', {}).get('next'):
-                page += 1
+
+    @staticmethod
+    def _format_custom_fields(field_ids: Dict[str, int], custom_fields: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Преобразует пользовательские поля вида {"field_name": ..., "values": [...]}
+        в формат custom_fields_values API. Неизвестные поля пропускаются
+        и логируются одним сообщением.
+        Args:
+            field_ids: Справочник ID пользовательских полей по их именам.
+            custom_fields: Список пользовательских полей для заполнения.
+        Returns:
+            Список значений пользовательских полей для тела запроса.
+        """
+        formatted_custom_fields = []
+        unknown_fields = []
+        for field in custom_fields:
+            field_id = field_ids.get(field["field_name"])
+            if field_id:
+                formatted_custom_fields.append({"field_id": field_id, "values": [{"value": v} for v in field["values"]]})
             else:
-                break
-        logger.debug(f"Fetched {len(all_data)} items for '{entity_key_in_embedded}' from {endpoint}")
-        return all_data
+                unknown_fields.append(field["field_name"])
+        if unknown_fields:
+            logger.warning(f"Пользовательские поля не найдены, пропускаем: {', '.join(unknown_fields)}")
+        return formatted_custom_fields
 
 
     async def _ensure_ids_initialized(self):
@@ -162,33 +405,54 @@ class AmoClient:
         """
         if self._initialized_ids:
             return
+        cached = self._ids_cache.get(self._base_url)
+        if cached is not None and time.monotonic() < cached[0]:
+            # Каждый экземпляр получает свои копии справочников, кэш остается неизменным
+            (self.pipelines_ids, self.statuses_ids, self.users_ids, self.custom_fields_lead_ids,
+             self.custom_fields_company_ids, self.task_types_ids, self._status_by_names) = copy.deepcopy(cached[1])
+            self._initialized_ids = True
+            logger.info("Справочники ID amoCRM взяты из кэша.")
+            return
         logger.info("Инициализация справочников ID из amoCRM...")
         try:
-            pipelines_data = await self._get_all_pages('/leads/pipelines', 'pipelines')
+            pipelines_data, users_data, lead_fields_data, company_fields_data = await asyncio.gather(
+                self._get_all_pages('/leads/pipelines', 'pipelines'),
+                self._get_all_pages('/users', 'users'),
+                self._get_all_pages('/leads/custom_fields', 'custom_fields'),
+                self._get_all_pages('/companies/custom_fields', 'custom_fields'),
+            )
+
             for p in pipelines_data:
-                self.pipelines_ids[p['name']] = p['id']
-                self.statuses_ids[p['id']] = {s['name']: s['id'] for s in p.get('_embedded', {}).get('statuses', [])}
-
-            users_data = await self._get_all_pages('/users', 'users')
-            for u in users_data:
-                self.users_ids[u['name']] = u['id']
-
-            lead_fields_data = await self._get_all_pages('/leads/custom_fields', 'custom_fields')
-            for cf in lead_fields_data:
-                self.custom_fields_lead_ids[cf['name']] = cf['id']
-
-            company_fields_data = await self._get_all_pages('/companies/custom_fields', 'custom_fields')
-            for cf in company_fields_data:
-                self.custom_fields_company_ids[cf['name']] = cf['id']
-                
-            self.custom_fields_company_ids[settings.CUSTOM_FIELD_NAME_COMPANY_PHONE] = next(
-                (cf['id'] for cf in company_fields_data if cf['name'] == settings.CUSTOM_FIELD_NAME_COMPANY_PHONE), None)
-            self.custom_fields_company_ids[settings.CUSTOM_FIELD_NAME_COMPANY_EMAIL] = next(
-                (cf['id'] for cf in company_fields_data if cf['name'] == settings.CUSTOM_FIELD_NAME_COMPANY_EMAIL), None)
+                self.pipelines_ids[sys.intern(p['name'])] = p['id']
+                self.statuses_ids[p['id']] = {sys.intern(s['name']): s['id'] for s in p.get('_embedded', {}).get('statuses', [])}
+
+            self.users_ids = {sys.intern(u['name']): u['id'] for u in users_data}
+            logger.debug(f"Users: {list(self.users_ids)}")
+
+            self.custom_fields_lead_ids = {sys.intern(cf['name']): cf['id'] for cf in lead_fields_data}
+            logger.debug(f"Lead custom fields: {list(self.custom_fields_lead_ids)}")
+
+            self.custom_fields_company_ids = {sys.intern(cf['name']): cf['id'] for cf in company_fields_data}
+            logger.debug(f"Company custom fields: {list(self.custom_fields_company_ids)}")
+            for field_name in (settings.CUSTOM_FIELD_NAME_INN_COMPANY, settings.CUSTOM_FIELD_NAME_COMPANY_PHONE,
+                               settings.CUSTOM_FIELD_NAME_COMPANY_EMAIL):
+                if field_name not in self.custom_fields_company_ids:
+                    logger.warning(f"Пользовательское поле компаний '{field_name}' не найдено в amoCRM.")
 
             self.task_types_ids = {}
             logger.info("Загрузка типов задач пропущена (эндпоинт /api/v4/tasks/types недоступен).")
 
+            self._status_by_names = {
+                (pipeline_name, status_name): (pipeline_id, status_id)
+                for pipeline_name, pipeline_id in self.pipelines_ids.items()
+                for status_name, status_id in self.statuses_ids.get(pipeline_id, {}).items()
+            }
+
+            self._ids_cache[self._base_url] = (
+                time.monotonic() + settings.amo_ids_cache_ttl,
+                copy.deepcopy((self.pipelines_ids, self.statuses_ids, self.users_ids, self.custom_fields_lead_ids,
+                               self.custom_fields_company_ids, self.task_types_ids, self._status_by_names)),
+            )
             self._initialized_ids = True
             logger.info("Инициализация ID из amoCRM (кроме типов задач) успешно завершена.")
         except Exception as e:
@@ -196,7 +460,7 @@ class AmoClient:
             raise RuntimeError(f"Failed to initialize IDs from AmoCRM: {e}")
 
 
-    async def get_pipeline_id(self, pipeline_name: str) -> Optional[int]:
+    def get_pipeline_id(self, pipeline_name: str) -> Optional[int]:
         """
         Возвращает ID воронки по ее имени.
 
@@ -208,7 +472,7 @@ class AmoClient:
         return self.pipelines_ids.get(pipeline_name)
 
 
-    async def get_status_id(self, pipeline_id: int, status_name: str) -> Optional[int]:
+    def get_status_id(self, pipeline_id: int, status_name: str) -> Optional[int]:
         """
         Возвращает ID статуса сделки по ID воронки и имени статуса.
 
@@ -221,7 +485,52 @@ class AmoClient:
         return self.statuses_ids.get(pipeline_id, {}).get(status_name)
 
 
-    async def get_user_id(self, user_name: str) -> Optional[int]:
+    def get_status_by_names(self, pipeline_name: str, status_name: str) -> Optional[Tuple[int, int]]:
+        """
+        Возвращает ID воронки и ID статуса по их именам за один поиск.
+
+        Args:
+            pipeline_name: Имя воронки.
+            status_name: Имя статуса.
+        Returns:
+            Кортеж (ID воронки, ID статуса) или None, если воронка или статус не найдены.
+        """
+        return self._status_by_names.get((pipeline_name, status_name))
+
+
+    def resolve_lead_context(
+        self,
+        pipeline_name: str,
+        status_name: str,
+        user_names: Iterable[str] = (),
+        custom_field_names: Iterable[str] = ()
+    ) -> LeadContext:
+        """
+        Разрешает за один вызов все ID, необходимые для создания сделок.
+
+        Args:
+            pipeline_name: Имя воронки.
+            status_name: Имя статуса в воронке.
+            user_names: Имена пользователей, ID которых нужно получить.
+            custom_field_names: Имена пользовательских полей сделок.
+        Returns:
+            LeadContext с ID воронки, статуса, пользователей (None для ненайденных)
+            и найденных пользовательских полей.
+        """
+        pipeline_id = self.pipelines_ids.get(pipeline_name)
+        status_pair = self._status_by_names.get((pipeline_name, status_name))
+        return LeadContext(
+            pipeline_id=pipeline_id,
+            status_id=status_pair[1] if status_pair else None,
+            user_ids={name: self.users_ids.get(name) for name in user_names},
+            custom_field_ids={
+                name: self.custom_fields_lead_ids[name]
+                for name in custom_field_names if name in self.custom_fields_lead_ids
+            },
+        )
+
+
+    def get_user_id(self, user_name: str) -> Optional[int]:
         """
         Возвращает ID пользователя по его имени.
 
@@ -233,7 +542,7 @@ class AmoClient:
         return self.users_ids.get(user_name)
 
 
-    async def get_custom_field_id_lead(self, field_name: str) -> Optional[int]:
+    def get_custom_field_id_lead(self, field_name: str) -> Optional[int]:
         """
         Возвращает ID пользовательского поля для сделок по его имени.
 
@@ -245,7 +554,7 @@ class AmoClient:
         return self.custom_fields_lead_ids.get(field_name)
 
 
-    async def get_custom_field_id_company(self, field_name: str) -> Optional[int]:
+    def get_custom_field_id_company(self, field_name: str) -> Optional[int]:
         """
         Возвращает ID пользовательского поля для компаний по его имени.
 
@@ -257,7 +566,7 @@ class AmoClient:
         return self.custom_fields_company_ids.get(field_name)
 
 
-    async def get_task_type_id(self, task_type_name: str) -> Optional[int]:
+    def get_task_type_id(self, task_type_name: str) -> Optional[int]:
         """
         Возвращает ID типа задачи по его имени.
 
@@ -273,6 +582,62 @@ class AmoClient:
         """
         Ищет компании по ИНН (пользовательское поле).
         Возвращает список найденных компаний.
+        Результаты кэшируются на короткое время, а одновременные поиски
+        одного и того же ИНН объединяются в один запрос к API.
+        Каждый вызов получает собственную копию результата.
+        Args:
+            inn: Значение ИНН для поиска.
+        Returns:
+            Список словарей, представляющих найденные компании.
+        """
+        cached = self._inn_cache.get(inn)
+        if cached and time.monotonic() < cached[0]:
+            self._inn_cache.move_to_end(inn)
+            return copy.deepcopy(cached[1])
+
+        inflight = self._inn_inflight.get(inn)
+        if inflight:
+            return copy.deepcopy(await asyncio.shield(inflight))
+
+        generation = self._inn_generations.get(inn, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._inn_inflight[inn] = future
+        try:
+            found_companies = await self._fetch_companies_by_inn(inn)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            if self._inn_generations.get(inn, 0) == generation:
+                self._inn_cache[inn] = (time.monotonic() + settings.amo_inn_cache_ttl, found_companies)
+                self._inn_cache.move_to_end(inn)
+                while len(self._inn_cache) > self._INN_CACHE_MAX_SIZE:
+                    self._inn_cache.popitem(last=False)
+            future.set_result(found_companies)
+            return copy.deepcopy(found_companies)
+        finally:
+            if not future.done():
+                future.cancel()
+            if self._inn_inflight.get(inn) is future:
+                del self._inn_inflight[inn]
+
+
+    def _invalidate_inn(self, inn: str) -> None:
+        """
+        Сбрасывает кэш поиска компаний по ИНН: удаляет сохраненный результат,
+        отвязывает выполняющийся поиск (его результат не попадет в кэш и не достанется новым вызовам).
+        Args:
+            inn: ИНН компании.
+        """
+        self._inn_cache.pop(inn, None)
+        self._inn_inflight.pop(inn, None)
+        self._inn_generations[inn] = self._inn_generations.get(inn, 0) + 1
+
+
+    async def _fetch_companies_by_inn(self, inn: str) -> List[Dict[str, Any]]:
+        """
+        Выполняет поиск компаний по ИНН через API без использования кэша.
         Args:
             inn: Значение ИНН для поиска.
         Returns:
@@ -287,29 +652,23 @@ class AmoClient:
             'query': inn,
             'with': 'custom_fields'
         }
-        companies = await self._get_all_pages('/companies', 'companies', params=params)
-        found_companies = []
-        for company in companies:
-            if 'custom_fields_values' in company:
-                for cf_value in company['custom_fields_values']:
-                    if cf_value['field_id'] == inn_field_id:
-                        for value in cf_value['values']:
-                            if value['value'] == inn:
-                                found_companies.append(company)
-                                break
-                        break
+        inn_str = str(inn)
+        found_companies = [
+            company async for company in self._iter_all_pages('/companies', 'companies', params=params)
+            if self._has_custom_field_value(company, inn_field_id, inn_str)
+        ]
         return found_companies
 
 
-    async def create_company(
-        self, 
-        name: str, 
+    def _build_company_payload(
+        self,
+        name: str,
         responsible_user_id: Optional[int] = None,
         inn: Optional[str] = None, phone_numbers: Optional[List[str]] = None,
         emails: Optional[List[str]] = None
-    ) -> Optional[Dict[str, Any]]:
+    ) -> Dict[str, Any]:
         """
-        Создает новую компанию в amoCRM.
+        Формирует тело одной компании для запроса на создание.
         Args:
             name: Название компании.
             responsible_user_id: ID ответственного пользователя.
@@ -317,7 +676,7 @@ class AmoClient:
             phone_numbers: Список телефонных номеров компании.
             emails: Список email-адресов компании.
         Returns:
-            Словарь, представляющий созданную компанию, или None в случае ошибки.
+            Словарь с данными компании в формате API.
         """
         payload_item: Dict[str, Any] = {"name": name}
 
@@ -361,30 +720,119 @@ class AmoClient:
         if custom_fields_values:
             payload_item["custom_fields_values"] = custom_fields_values
 
-        payload = [payload_item]
-        try:
-            response = await self._request('POST', "/companies", json_data=payload)
-            if response and '_embedded' in response and 'companies' in response['_embedded']:
-                created_company = response['_embedded']['companies'][0]
-                logger.info(f"Компания '{created_company.get('name')}' (ID: {created_company.get('id')}) успешно создана.")
-                return created_company
-            else:
-                logger.error(f"Неожиданный ответ при создании компании: {response}")
-                return None
-        except ClientResponseError as e:
-            logger.error(f"Ошибка при создании компании '{name}': {e.status}, message='{e.message}', url='{e.url}'")
-            return None
-        except Exception as e:
-            logger.error(f"Неизвестная ошибка при создании компании '{name}': {e}", exc_info=True)
-            return None
+        return payload_item
+
+
+    async def create_companies_bulk(self, companies: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Создает компании пакетами (до 250 компаний в одном запросе).
+        Args:
+            companies: Список словарей с аргументами create_company для каждой компании.
+        Returns:
+            Список созданных компаний в порядке входного списка;
+            None на месте компаний, которые не удалось создать.
+        """
+        created: List[Optional[Dict[str, Any]]] = [None] * len(companies)
+        inns = [company['inn'] for company in companies if company.get('inn')]
+        for inn in inns:
+            self._invalidate_inn(inn)
+        for offset in range(0, len(companies), self._BATCH_SIZE):
+            batch = companies[offset:offset + self._BATCH_SIZE]
+            payload = [
+                {**self._build_company_payload(**company), "request_id": str(offset + i)}
+                for i, company in enumerate(batch)
+            ]
+            try:
+                response = await self._request('POST', "/companies", json_data=payload)
+            except ClientResponseError as e:
+                logger.error(f"Ошибка при пакетном создании компаний ({len(batch)} шт.): {e.status}, message='{e.message}', url='{e.url}'")
+                continue
+            except Exception as e:
+                logger.error(f"Неизвестная ошибка при пакетном создании компаний ({len(batch)} шт.): {e}", exc_info=True)
+                continue
+            if not response or not response.get('_embedded', {}).get('companies'):
+                logger.error(f"Неожиданный ответ при создании компаний: {response}")
+                continue
+            for i, created_company in enumerate(response['_embedded']['companies']):
+                index = int(created_company.get('request_id', offset + i))
+                created[index] = created_company
+        # Поиск, начатый во время создания, мог не увидеть новые компании
+        for inn in inns:
+            self._invalidate_inn(inn)
+        return created
+
+
+    async def create_company(
+        self, 
+        name: str, 
+        responsible_user_id: Optional[int] = None,
+        inn: Optional[str] = None, phone_numbers: Optional[List[str]] = None,
+        emails: Optional[List[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Создает новую компанию в amoCRM.
+        Args:
+            name: Название компании.
+            responsible_user_id: ID ответственного пользователя.
+            inn: ИНН компании.
+            phone_numbers: Список телефонных номеров компании.
+            emails: Список email-адресов компании.
+        Returns:
+            Словарь, представляющий созданную компанию, или None в случае ошибки.
+        """
+        created_company = (await self.create_companies_bulk([{
+            "name": name,
+            "responsible_user_id": responsible_user_id,
+            "inn": inn,
+            "phone_numbers": phone_numbers,
+            "emails": emails,
+        }]))[0]
+        if created_company:
+            logger.info(f"Компания '{name}' (ID: {created_company.get('id')}) успешно создана.")
+        else:
+            logger.error(f"Не удалось создать компанию '{name}'.")
+        return created_company
+
 
+    async def _search_by_custom_field(
+        self,
+        endpoint: str,
+        entity_key_in_embedded: str,
+        params: Dict[str, Any],
+        field_id: int,
+        value: Any,
+        first_only: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Обходит страницы эндпоинта и отбирает сущности, у которых пользовательское
+        поле содержит указанное значение.
+        Args:
+            endpoint: Эндпоинт API.
+            entity_key_in_embedded: Ключ списка сущностей в '_embedded'.
+            params: Параметры запроса.
+            field_id: ID пользовательского поля.
+            value: Искомое значение.
+            first_only: Остановить обход на первом совпадении, не запрашивая остальные страницы.
+        Returns:
+            Список найденных сущностей.
+        """
+        found = []
+        async with contextlib.aclosing(self._iter_all_pages(endpoint, entity_key_in_embedded, params=params)) as entities:
+            async for entity in entities:
+                if self._has_custom_field_value(entity, field_id, value):
+                    found.append(entity)
+                    if first_only:
+                        break
+        return found
 
-    async def search_leads_by_name(self, pipeline_id: int, purchase_number:str) -> List[Dict[str, Any]]:
+
+    async def search_leads_by_name(self, pipeline_id: int, purchase_number: str, first_only: bool = False) -> List[Dict[str, Any]]:
         """
         Ищет сделки в конкретной воронке по номеру закупки.
         Args:
             pipeline_id: ID воронки.
             purchase_number: Номер закупки для поиска.
+            first_only: Вернуть только первую найденную сделку.
         Returns:
             Список словарей, представляющих найденные сделки.
         """
@@ -397,43 +845,91 @@ class AmoClient:
             'query': purchase_number,
             'filter[pipelines][0][id]': pipeline_id,
         }
-
-        leads = await self._get_all_pages('/leads', 'leads', params=params)
-        
-        filtered_leads = []
-        for lead in leads:
-            if 'custom_fields_values' in lead:
-                for cf_value in lead['custom_fields_values']:
-                    if cf_value['field_id'] == purchase_number_field_id:
-                        for value_obj in cf_value.get('values', []):
-                            if value_obj.get('value') == purchase_number:
-                                filtered_leads.append(lead)
-                                break
-                        if filtered_leads and filtered_leads[-1]['id'] == lead['id']:
-                            break
-        return filtered_leads
+        return await self._search_by_custom_field(
+            '/leads', 'leads', params, purchase_number_field_id, purchase_number, first_only=first_only
+        )
     
 
-    async def search_leads_by_inn(self, pipeline_id: int, inn: str) -> List[Dict[str, Any]]:
+    async def search_leads_by_inn(self, pipeline_id: int, inn: str, first_only: bool = False) -> List[Dict[str, Any]]:
         """Ищет сделки в конкретной воронке по ИНН клиента."""
         inn_field_id = self.custom_fields_lead_ids.get(settings.CUSTOM_FIELD_NAME_INN_LEAD)
         if not inn_field_id:
             logger.warning(f"Пользовательское поле '{settings.CUSTOM_FIELD_NAME_INN_LEAD}' не найдено для сделок. Поиск по номеру закупки невозможен.")
             return []
         params = {'query': inn, 'filter[pipelines][0][id]': pipeline_id}
-        leads = await self._get_all_pages('/leads', 'leads', params=params)
-        filtered_leads = []
-        for lead in leads:
-            if 'custom_fields_values' in lead:
-                for cf_value in lead['custom_fields_values']:
-                    if cf_value['field_id'] == inn_field_id:
-                        for value_obj in cf_value.get('values', []):
-                            if value_obj.get('value') == inn:
-                                filtered_leads.append(lead)
-                                break
-                        if filtered_leads and filtered_leads[-1]['id'] == lead['id']:
-                            break
-        return filtered_leads
+        return await self._search_by_custom_field('/leads', 'leads', params, inn_field_id, inn, first_only=first_only)
+
+
+    def _build_lead_payload(
+        self,
+        name: str,
+        price: float,
+        pipeline_id: int,
+        status_id: int,
+        responsible_user_id: Optional[int] = None,
+        company_id: Optional[int] = None,
+        custom_fields: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Формирует тело одной сделки для запроса на создание.
+        Args:
+            name: Название сделки.
+            price: Бюджет сделки.
+            pipeline_id: ID воронки.
+            status_id: ID статуса в воронке.
+            responsible_user_id: ID ответственного пользователя.
+            company_id: ID связанной компании.
+            custom_fields: Список пользовательских полей для заполнения.
+        Returns:
+            Словарь с данными сделки в формате API.
+        """
+        payload_item: Dict[str, Any] = {
+            "name": name,
+            "price": int(price),
+            "pipeline_id": pipeline_id,
+            "status_id": status_id,
+        }
+        if responsible_user_id:
+            payload_item["responsible_user_id"] = responsible_user_id
+        if company_id:
+            payload_item["_embedded"] = {"companies": [{"id": company_id}]}
+
+        if custom_fields:
+            formatted_custom_fields = self._format_custom_fields(self.custom_fields_lead_ids, custom_fields)
+            if formatted_custom_fields:
+                payload_item["custom_fields_values"] = formatted_custom_fields
+        return payload_item
+
+
+    async def create_leads_bulk(self, leads: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Создает сделки пакетами (до 250 сделок в одном запросе).
+        Args:
+            leads: Список словарей с аргументами create_lead для каждой сделки.
+        Returns:
+            Список созданных сделок в порядке входного списка;
+            None на месте сделок, которые не удалось создать.
+        """
+        created: List[Optional[Dict[str, Any]]] = [None] * len(leads)
+        for offset in range(0, len(leads), self._BATCH_SIZE):
+            batch = leads[offset:offset + self._BATCH_SIZE]
+            payload = [
+                {**self._build_lead_payload(**lead), "request_id": str(offset + i)}
+                for i, lead in enumerate(batch)
+            ]
+            try:
+                response = await self._request('POST', '/leads', json_data=payload)
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном создании сделок ({len(batch)} шт.): {e}", exc_info=True)
+                continue
+            if not response or not response.get('_embedded', {}).get('leads'):
+                logger.error(f"Неожиданный ответ при пакетном создании сделок: {response}")
+                continue
+            for i, created_lead in enumerate(response['_embedded']['leads']):
+                index = int(created_lead.get('request_id', offset + i))
+                created[index] = created_lead
+        logger.info(f"Создано сделок: {sum(lead is not None for lead in created)} из {len(leads)}.")
+        return created
 
 
     async def create_lead(
@@ -458,39 +954,86 @@ class AmoClient:
         Returns:
             Словарь, представляющий созданную сделку, или None в случае ошибки.
         """
-        payload_item: Dict[str, Any] = {
+        created_lead = (await self.create_leads_bulk([{
             "name": name,
-            "price": int(price),
+            "price": price,
             "pipeline_id": pipeline_id,
             "status_id": status_id,
-        }
+            "responsible_user_id": responsible_user_id,
+            "company_id": company_id,
+            "custom_fields": custom_fields,
+        }]))[0]
+        if created_lead:
+            logger.info(f"Создана сделка '{name}' (ID: {created_lead.get('id')}).")
+        else:
+            logger.error(f"Ошибка при создании сделки '{name}'.")
+        return created_lead
+
+
+    def _build_lead_update_payload(
+            self,
+            lead_id: int,
+            name: Optional[str] = None,
+            price: Optional[float] = None,
+            status_id: Optional[int] = None,
+            responsible_user_id: Optional[int] = None,
+            custom_fields: Optional[List[Dict[str, Any]]] = None
+        ) -> Dict[str, Any]:
+        """
+        Формирует тело запроса на обновление одной сделки.
+        Args:
+            lead_id: ID сделки, которую нужно обновить.
+            name: Новое название сделки (опционально).
+            price: Новый бюджет сделки (опционально).
+            status_id: Новый ID статуса (опционально).
+            responsible_user_id: Новый ID ответственного (опционально).
+            custom_fields: Список пользовательских полей для обновления.
+        Returns:
+            Словарь с данными сделки для PATCH /leads.
+        """
+        payload_item: Dict[str, Any] = {"id": lead_id}
+        if name:
+            payload_item["name"] = name
+        if price is not None:
+            payload_item["price"] = int(price)
+        if status_id:
+            payload_item["status_id"] = status_id
         if responsible_user_id:
             payload_item["responsible_user_id"] = responsible_user_id
-        if company_id:
-            payload_item["_embedded"] = {"companies": [{"id": company_id}]}
 
         if custom_fields:
-            formatted_custom_fields = []
-            for field in custom_fields:
-                field_id = self.custom_fields_lead_ids.get(field["field_name"])
-                if field_id:
-                    formatted_custom_fields.append({"field_id": field_id, "values": [{"value": v} for v in field["values"]]})
-                else:
-                    logger.warning(f"Пользовательское поле '{field['field_name']}' не найдено. Пропускаем.")
+            formatted_custom_fields = self._format_custom_fields(self.custom_fields_lead_ids, custom_fields)
             if formatted_custom_fields:
                 payload_item["custom_fields_values"] = formatted_custom_fields
+        return payload_item
 
-        payload = [payload_item]
-        try:
-            response = await self._request('POST', '/leads', json_data=payload)
-            if response and '_embedded' in response and 'leads' in response['_embedded'] and response['_embedded']['leads']:
-                created_lead = response['_embedded']['leads'][0]
-                logger.info(f"Создана сделка '{name}' (ID: {created_lead.get('id')}).")
-                return created_lead
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка при создании сделки '{name}': {e}", exc_info=True)
-            return None
+
+    async def update_leads_bulk(self, updates: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Обновляет сделки пакетами (до 250 сделок в одном запросе).
+        Args:
+            updates: Список словарей с аргументами update_lead для каждой сделки.
+        Returns:
+            Список обновленных сделок в порядке входного списка;
+            None на месте сделок, которые не удалось обновить.
+        """
+        updated: List[Optional[Dict[str, Any]]] = [None] * len(updates)
+        for offset in range(0, len(updates), self._BATCH_SIZE):
+            batch = updates[offset:offset + self._BATCH_SIZE]
+            payload = [self._build_lead_update_payload(**update) for update in batch]
+            try:
+                response = await self._request('PATCH', '/leads', json_data=payload)
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном обновлении сделок ({len(batch)} шт.): {e}", exc_info=True)
+                continue
+            if not response or not response.get('_embedded', {}).get('leads'):
+                logger.error(f"Неожиданный ответ при пакетном обновлении сделок: {response}")
+                continue
+            updated_by_id = {lead.get('id'): lead for lead in response['_embedded']['leads']}
+            for i, update in enumerate(batch):
+                updated[offset + i] = updated_by_id.get(update['lead_id'])
+        logger.info(f"Обновлено сделок: {sum(lead is not None for lead in updated)} из {len(updates)}.")
+        return updated
 
 
     async def update_lead(
@@ -514,38 +1057,55 @@ class AmoClient:
         Returns:
             Словарь, представляющий обновленную сделку, или None в случае ошибки.
         """
-        payload_item: Dict[str, Any] = {"id": lead_id}
-        if name:
-            payload_item["name"] = name
-        if price is not None:
-            payload_item["price"] = int(price)
-        if status_id:
-            payload_item["status_id"] = status_id
-        if responsible_user_id:
-            payload_item["responsible_user_id"] = responsible_user_id
+        updated_lead = (await self.update_leads_bulk([{
+            "lead_id": lead_id,
+            "name": name,
+            "price": price,
+            "status_id": status_id,
+            "responsible_user_id": responsible_user_id,
+            "custom_fields": custom_fields,
+        }]))[0]
+        if updated_lead:
+            logger.info(f"Сделка ID {lead_id} успешно обновлена.")
+        else:
+            logger.error(f"Ошибка при обновлении сделки ID {lead_id}.")
+        return updated_lead
 
-        if custom_fields:
-            formatted_custom_fields = []
-            for field in custom_fields:
-                field_id = self.custom_fields_lead_ids.get(field["field_name"])
-                if field_id:
-                    formatted_custom_fields.append({"field_id": field_id, "values": [{"value": v} for v in field["values"]]})
-                else:
-                    logger.warning(f"Пользовательское поле '{field['field_name']}' не найдено. Пропускаем при обновлении.")
-            if formatted_custom_fields:
-                payload_item["custom_fields_values"] = formatted_custom_fields
 
-        payload = [payload_item]
-        try:
-            response = await self._request('PATCH', '/leads', json_data=payload)
-            if response and '_embedded' in response and 'leads' in response['_embedded'] and response['_embedded']['leads']:
-                updated_lead = response['_embedded']['leads'][0]
-                logger.info(f"Сделка ID {lead_id} успешно обновлена.")
-                return updated_lead
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении сделки ID {lead_id}: {e}", exc_info=True)
-            return None
+    async def add_notes_to_leads_bulk(self, notes: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Добавляет примечания к сделкам пакетами (до 250 примечаний в одном запросе).
+        Args:
+            notes: Список словарей с ключами 'lead_id' и 'text'.
+        Returns:
+            Список созданных примечаний в порядке входного списка;
+            None на месте примечаний, которые не удалось добавить.
+        """
+        created: List[Optional[Dict[str, Any]]] = [None] * len(notes)
+        for offset in range(0, len(notes), self._BATCH_SIZE):
+            batch = notes[offset:offset + self._BATCH_SIZE]
+            payload = [
+                {
+                    "entity_id": note["lead_id"],
+                    "note_type": "common",
+                    "params": {"text": note["text"]},
+                    "request_id": str(offset + i),
+                }
+                for i, note in enumerate(batch)
+            ]
+            try:
+                response = await self._request('POST', '/leads/notes', json_data=payload)
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном добавлении примечаний ({len(batch)} шт.): {e}", exc_info=True)
+                continue
+            if not response or not response.get('_embedded', {}).get('notes'):
+                logger.error(f"Неожиданный ответ при пакетном добавлении примечаний: {response}")
+                continue
+            for i, created_note in enumerate(response['_embedded']['notes']):
+                index = int(created_note.get('request_id', offset + i))
+                created[index] = created_note
+        logger.info(f"Добавлено примечаний: {sum(note is not None for note in created)} из {len(notes)}.")
+        return created
 
 
     async def add_note_to_lead(self, lead_id: int, text: str) -> Optional[Dict[str, Any]]:
@@ -557,28 +1117,15 @@ class AmoClient:
         Returns:
             Словарь, представляющий созданное примечание, или None в случае ошибки.
         """
-        payload = [
-            {
-                "entity_id": lead_id,
-                "note_type": "common",
-                "params": {
-                    "text": text
-                }
-            }
-        ]
-        try:
-            response = await self._request('POST', '/leads/notes', json_data=payload)
-            if response and '_embedded' in response and 'notes' in response['_embedded'] and response['_embedded']['notes']:
-                created_note = response['_embedded']['notes'][0]
-                logger.info(f"Примечание успешно добавлено к сделке ID {lead_id}.")
-                return created_note
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка при добавлении примечания к сделке ID {lead_id}: {e}", exc_info=True)
-            return None
+        created_note = (await self.add_notes_to_leads_bulk([{"lead_id": lead_id, "text": text}]))[0]
+        if created_note:
+            logger.info(f"Примечание успешно добавлено к сделке ID {lead_id}.")
+        else:
+            logger.error(f"Ошибка при добавлении примечания к сделке ID {lead_id}.")
+        return created_note
 
 
-    async def create_task(
+    def _build_task_payload(
         self,
         entity_id: int,
         responsible_user_id: int,
@@ -588,7 +1135,7 @@ class AmoClient:
         task_type_name: Optional[str] = None
     ) -> Optional[Dict[str, Any]]:
         """
-        Создает новую задачу в amoCRM для указанной сущности.
+        Формирует тело запроса на создание одной задачи.
         Args:
             entity_id: ID сущности (сделки, контакта, компании), к которой привязана задача.
             responsible_user_id: ID ответственного пользователя.
@@ -597,7 +1144,7 @@ class AmoClient:
             entity_type: Тип сущности ("leads", "contacts", "companies"). По умолчанию "leads".
             task_type_name: Имя типа задачи. Если None, будет использован тип по умолчанию из settings.
         Returns:
-            Словарь, представляющий созданную задачу, или None в случае ошибки или некорректных входных данных.
+            Словарь с данными задачи для POST /tasks или None при некорректных входных данных.
         """
         if not all([entity_id, responsible_user_id, text, complete_till_timestamp]):
             logger.error("Недостаточно данных для создания задачи: entity_id, responsible_user_id, text, complete_till_timestamp должны быть заполнены.")
@@ -618,25 +1165,77 @@ class AmoClient:
             payload_item["task_type_id"] = task_type_id
         else:
             logger.warning(f"Тип задачи '{task_type_to_use_name}' не найден по имени в справочнике ID. Задача будет создана без явного указания типа. Возможно, AmoCRM применит тип по умолчанию.")
-            
-        payload = [payload_item]
-        try:
-            async with self._rate_limit:
-                response = await self._request('POST', "/tasks", json_data=payload)
-            
-            if response and '_embedded' in response and 'tasks' in response['_embedded']:
-                created_task = response['_embedded']['tasks'][0]
-                logger.info(f"Задача ID {created_task.get('id')} успешно создана для {entity_type} ID {entity_id}.")
-                return created_task
-            else:
-                logger.error(f"Неожиданный ответ при создании задачи: {response}")
-                return None
-        except ClientResponseError as e:
-            logger.error(f"Ошибка при создании задачи для {entity_type} ID {entity_id}: {e.status}, message='{e.message}', url='{e.url}'")
-            return None
-        except Exception as e:
-            logger.error(f"Неизвестная ошибка при создании задачи для {entity_type} ID {entity_id}: {e}", exc_info=True)
-            return None
+        return payload_item
+
+
+    async def create_tasks_bulk(self, tasks: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Создает задачи пакетами (до 250 задач в одном запросе).
+        Args:
+            tasks: Список словарей с аргументами create_task для каждой задачи.
+        Returns:
+            Список созданных задач в порядке входного списка;
+            None на месте задач, которые не удалось создать.
+        """
+        created: List[Optional[Dict[str, Any]]] = [None] * len(tasks)
+        payloads = [
+            (index, payload_item)
+            for index, task in enumerate(tasks)
+            if (payload_item := self._build_task_payload(**task)) is not None
+        ]
+        for offset in range(0, len(payloads), self._BATCH_SIZE):
+            batch = payloads[offset:offset + self._BATCH_SIZE]
+            payload = [{**payload_item, "request_id": str(index)} for index, payload_item in batch]
+            try:
+                response = await self._request('POST', '/tasks', json_data=payload)
+            except ClientResponseError as e:
+                logger.error(f"Ошибка при пакетном создании задач ({len(batch)} шт.): {e.status}, message='{e.message}', url='{e.url}'")
+                continue
+            except Exception as e:
+                logger.error(f"Неизвестная ошибка при пакетном создании задач ({len(batch)} шт.): {e}", exc_info=True)
+                continue
+            if not response or not response.get('_embedded', {}).get('tasks'):
+                logger.error(f"Неожиданный ответ при создании задач: {response}")
+                continue
+            for i, created_task in enumerate(response['_embedded']['tasks']):
+                index = int(created_task.get('request_id', batch[i][0]))
+                created[index] = created_task
+        logger.info(f"Создано задач: {sum(task is not None for task in created)} из {len(tasks)}.")
+        return created
+
+
+    async def create_task(
+        self,
+        entity_id: int,
+        responsible_user_id: int,
+        text: str,
+        complete_till_timestamp: int,
+        entity_type: str = "leads",
+        task_type_name: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Создает новую задачу в amoCRM для указанной сущности.
+        Args:
+            entity_id: ID сущности (сделки, контакта, компании), к которой привязана задача.
+            responsible_user_id: ID ответственного пользователя.
+            text: Текст задачи.
+            complete_till_timestamp: Время завершения задачи в формате Unix timestamp.
+            entity_type: Тип сущности ("leads", "contacts", "companies"). По умолчанию "leads".
+            task_type_name: Имя типа задачи. Если None, будет использован тип по умолчанию из settings.
+        Returns:
+            Словарь, представляющий созданную задачу, или None в случае ошибки или некорректных входных данных.
+        """
+        created_task = (await self.create_tasks_bulk([{
+            "entity_id": entity_id,
+            "responsible_user_id": responsible_user_id,
+            "text": text,
+            "complete_till_timestamp": complete_till_timestamp,
+            "entity_type": entity_type,
+            "task_type_name": task_type_name,
+        }]))[0]
+        if created_task:
+            logger.info(f"Задача ID {created_task.get('id')} успешно создана для {entity_type} ID {entity_id}.")
+        return created_task
 
 
     async def get_linked_companies_to_lead(self, lead_id: int) -> List[Dict[str, Any]]:
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов по алгоритму "token bucket".
+    Хранит только текущее число токенов и время последнего пополнения,
+    пополнение выполняется лениво при каждом запросе токена.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Скорость пополнения (токенов в секунду).
+            capacity: Максимальное число токенов (допустимый всплеск запросов).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Ожидает, пока в ведре наберется нужное число токенов, и забирает их.
+        Ожидающие обслуживаются в порядке очереди.
+        Args:
+            amount: Число токенов для запроса.
+        """
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def penalize(self, seconds: float = 1.0) -> None:
+        """
+        Опустошает ведро и уводит его в "долг", чтобы следующие запросы
+        подождали указанное время (например, после ответа 429 от сервера).
+        Повторные вызовы не суммируются: несколько одновременных ответов 429
+        дают одну паузу максимальной длительности.
+        Args:
+            seconds: Длительность паузы для всех ожидающих запросов.
+        """
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
@@ -1,10 +1,17 @@
+import re
 from datetime import date, datetime
-from typing import Optional, Iterable
+from functools import cached_property
+from typing import Optional, Tuple
 
-from pydantic import BaseModel, Field, AliasChoices, field_validator
+from pydantic import BaseModel, ConfigDict, Field, AliasChoices, field_validator
+
+_NON_DIGITS = re.compile(r'[^0-9]')
+_FLOAT_ZERO_FRACTION = re.compile(r'\.0+$')
 
 
 class StatePurchase(BaseModel):
+    model_config = ConfigDict(frozen=True, populate_by_name=True)
+
     eis_url: Optional[str] = Field(None, alias='Закупка в ЕИС')
     winner_name: Optional[str] = Field(None, alias='Победитель')
     inn: Optional[str] = Field(None, alias="ИНН победителя")
@@ -31,23 +38,30 @@ class StatePurchase(BaseModel):
     time_zone: Optional[str] = Field(None, alias='Часовой пояс (МСК)')
 
     @field_validator('phone_1', 'phone_2', 'phone_3', 'inn', mode='before')
-    def validate_numbers_to_str(cls, v: Optional[int | float]) -> Optional[str]:
-        if v is not None:
-            val = int(v)
-            return str(val)
-        return None
-
-    @property
-    def phones(self) -> Iterable[str]:
-        return (phone for phone in (self.phone_1, self.phone_2, self.phone_3) if phone)
-
-    @property
-    def emails(self) -> Iterable[str]:
-        return (email for email in (self.email_1, self.email_2, self.email_3) if email)
-
-    @property
-    def fios(self) -> Iterable[str]:
-        return (fio for fio in (self.fio_1, self.fio_2, self.fio_3) if fio)
+    def validate_numbers_to_str(cls, v: Optional[int | float | str]) -> Optional[str]:
+        if v is None:
+            return None
+        if isinstance(v, str):
+            if v.isascii() and v.isdigit():
+                return v
+            # Из строки остаются только цифры ('+7 (912) 345-67-89' -> '79123456789'),
+            # строка без цифр ('нет', '-') считается пустым значением
+            return _NON_DIGITS.sub('', _FLOAT_ZERO_FRACTION.sub('', v.strip())) or None
+        if isinstance(v, (int, float)):
+            return str(int(v))
+        return str(v)
+
+    @cached_property
+    def phones(self) -> Tuple[str, ...]:
+        return tuple(phone for phone in (self.phone_1, self.phone_2, self.phone_3) if phone)
+
+    @cached_property
+    def emails(self) -> Tuple[str, ...]:
+        return tuple(email for email in (self.email_1, self.email_2, self.email_3) if email)
+
+    @cached_property
+    def fios(self) -> Tuple[str, ...]:
+        return tuple(fio for fio in (self.fio_1, self.fio_2, self.fio_3) if fio)
 
 
 class DBStatePurchase(StatePurchase):
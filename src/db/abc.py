@@ -1,9 +1,14 @@
+import asyncio
+import logging
 from abc import ABC, abstractmethod
 from collections.abc import Iterable
+from itertools import batched
 from typing import Self
 
 from src.amo.schemas import DBStatePurchase
 
+logger = logging.getLogger(__name__)
+
 
 class DB(ABC):
     """Абстрактный класс для реализации работы с БД"""
@@ -19,7 +24,9 @@ class DB(ABC):
     @abstractmethod
     async def write_purchases(self, purchases: Iterable[DBStatePurchase]) -> None:
         """
-        Записывает коллекцию закупок в БД
+        Записывает коллекцию закупок в БД.
+        Реализации должны писать пачками (многострочный INSERT, execute-many, COPY),
+        а не выполнять отдельный запрос на каждую закупку
         :param purchases: Закупки
         """
         ...
@@ -37,3 +44,40 @@ class DB(ABC):
         Закрывает соединение к БД
         """
         ...
+
+
+class BatchInsertMixin(ABC):
+    """
+    Миксин пакетной записи: делит коллекцию закупок на пачки по `batch_size`
+    и параллельно передает пачки в `_write_batch`. Используется вместе с `DB`
+    """
+    batch_size: int = 1000
+
+    async def write_purchases(self, purchases: Iterable[DBStatePurchase]) -> None:
+        """
+        Записывает закупки пачками параллельно. Повторы номера закупки схлопываются
+        до последней записи заранее, чтобы параллельные пачки не обновляли одну и ту же строку.
+        При ошибке одной пачки остальные отменяются до выхода, чтобы не писать в уже закрываемое подключение
+        :param purchases: Закупки
+        """
+        unique = {purchase.purchase_number: purchase for purchase in purchases}
+        logger.info(f"Запись в БД: {len(unique)} закупок пачками по {self.batch_size}...")
+        tasks = [
+            asyncio.create_task(self._write_batch(batch)) for batch in batched(unique.values(), self.batch_size)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        logger.info(f"Записано в БД закупок: {len(unique)}.")
+
+    @abstractmethod
+    async def _write_batch(self, batch: tuple[DBStatePurchase, ...]) -> None:
+        """
+        Записывает одну пачку закупок одним обращением к БД
+        :param batch: Пачка закупок
+        """
+        ...
@@ -1,109 +1,93 @@
-from typing import Iterable
+from operator import itemgetter
 
-from aiopg import connect
+from aiopg import create_pool
 
-from ..abc import DB
+from ..abc import DB, BatchInsertMixin
 from ...amo.schemas import DBStatePurchase
 from ...settings import settings
 
+_COLUMNS = (
+    ('eis_url', 'text'),
+    ('winner_name', 'text'),
+    ('inn', 'text'),
+    ('result_date', 'date'),
+    ('customer_name', 'text'),
+    ('nmck', 'numeric'),
+    ('contract_securing', 'numeric'),
+    ('warranty_obligations_securing', 'numeric'),
+    ('contract_end_date', 'date'),
+    ('winner_price', 'numeric'),
+    ('phone_1', 'text'),
+    ('fio_1', 'text'),
+    ('email_1', 'text'),
+    ('phone_2', 'text'),
+    ('fio_2', 'text'),
+    ('email_2', 'text'),
+    ('phone_3', 'text'),
+    ('fio_3', 'text'),
+    ('email_3', 'text'),
+    ('smp_advantages', 'text'),
+    ('smp_status', 'text'),
+    ('extraction_dt', 'timestamptz'),
+    ('purchase_number', 'text'),
+)
+_COLUMN_NAMES = tuple(name for name, _ in _COLUMNS)
+_ROW_GETTER = itemgetter(*_COLUMN_NAMES)
 
-class PostgresDB(DB):
-    async def write_purchases(self, purchases: Iterable[DBStatePurchase]) -> None:
-        print("writing data to DB...")
-        for purchase in purchases:
-            await self._write_purchase(purchase)
-        print("DONE!")
+# Пачка передается в виде массивов по столбцам и разворачивается через unnest:
+# текст запроса не растет с размером пачки. Запрос готовится один раз на соединение
+# (PREPARE), дальше на сервер уходят только параметры (EXECUTE).
+_PREPARED_NAME = "upsert_state_purchases"
+_PREPARE_STMT = (
+    f"PREPARE {_PREPARED_NAME} ({', '.join(f'{sql_type}[]' for _, sql_type in _COLUMNS)}) AS "
+    f"INSERT INTO state_purchases ({', '.join(_COLUMN_NAMES)}) "
+    f"SELECT * FROM unnest({', '.join(f'${i}' for i in range(1, len(_COLUMNS) + 1))}) "
+    "ON CONFLICT (purchase_number) DO UPDATE SET "
+    + ", ".join(f"{name} = EXCLUDED.{name}" for name in _COLUMN_NAMES if name != 'purchase_number')
+)
+_EXECUTE_STMT = f"EXECUTE {_PREPARED_NAME} ({', '.join(f'%s::{sql_type}[]' for _, sql_type in _COLUMNS)})"
 
-    async def _write_purchase(self, purchase: DBStatePurchase) -> None:
-        stmt = """
-                INSERT INTO state_purchases (
-                eis_url,
-                winner_name,
-                inn,
-                result_date,
-                customer_name,
-                nmck,
-                contract_securing,
-                warranty_obligations_securing,
-                contract_end_date,
-                winner_price,
-                phone_1,
-                fio_1,
-                email_1,
-                phone_2,
-                fio_2,
-                email_2,
-                phone_3,
-                fio_3,
-                email_3,
-                smp_advantages,
-                smp_status,
-                extraction_dt,
-                purchase_number
-            ) VALUES (
-                %(eis_url)s,
-                %(winner_name)s,
-                %(inn)s,
-                %(result_date)s,
-                %(customer_name)s,
-                %(nmck)s,
-                %(contract_securing)s,
-                %(warranty_obligations_securing)s,
-                %(contract_end_date)s,
-                %(winner_price)s,
-                %(phone_1)s,
-                %(fio_1)s,
-                %(email_1)s,
-                %(phone_2)s,
-                %(fio_2)s,
-                %(email_2)s,
-                %(phone_3)s,
-                %(fio_3)s,
-                %(email_3)s,
-                %(smp_advantages)s,
-                %(smp_status)s,
-                %(extraction_dt)s,
-                %(purchase_number)s
-            )
-            ON CONFLICT (purchase_number) DO UPDATE SET
-                eis_url = EXCLUDED.eis_url,
-                winner_name = EXCLUDED.winner_name,
-                inn = EXCLUDED.inn,
-                result_date = EXCLUDED.result_date,
-                customer_name = EXCLUDED.customer_name,
-                nmck = EXCLUDED.nmck,
-                contract_securing = EXCLUDED.contract_securing,
-                warranty_obligations_securing = EXCLUDED.warranty_obligations_securing,
-                contract_end_date = EXCLUDED.contract_end_date,
-                winner_price = EXCLUDED.winner_price,
-                phone_1 = EXCLUDED.phone_1,
-                fio_1 = EXCLUDED.fio_1,
-                email_1 = EXCLUDED.email_1,
-                phone_2 = EXCLUDED.phone_2,
-                fio_2 = EXCLUDED.fio_2,
-                email_2 = EXCLUDED.email_2,
-                phone_3 = EXCLUDED.phone_3,
-                fio_3 = EXCLUDED.fio_3,
-                email_3 = EXCLUDED.email_3,
-                smp_advantages = EXCLUDED.smp_advantages,
-                smp_status = EXCLUDED.smp_status,
-                extraction_dt = EXCLUDED.extraction_dt
-                """
-        await self._execute_statement(stmt, **purchase.model_dump(by_alias=False))
 
-    async def _execute_statement(self, stmt: str, **kwargs) -> None:
-        async with self._conn.cursor() as cursor:
-            await cursor.execute(stmt, kwargs)
+async def _prepare_connection(conn) -> None:
+    """
+    Готовит upsert-запрос на новом соединении пула
+    :param conn: Соединение aiopg
+    """
+    async with conn.cursor() as cursor:
+        await cursor.execute(_PREPARE_STMT)
+
+
+class PostgresDB(BatchInsertMixin, DB):
+    async def _write_batch(self, batch: tuple[DBStatePurchase, ...]) -> None:
+        """
+        Записывает пачку закупок подготовленным INSERT ... SELECT FROM unnest(...) ON CONFLICT.
+        Каждая пачка берет свое соединение из пула, так что одновременно пишется
+        не больше `db_pool_max_size` пачек.
+        Номера закупок в пачке должны быть уникальны: один INSERT не может
+        обновить одну и ту же строку дважды
+        :param batch: Пачка закупок
+        """
+        column_values = [list(column) for column in zip(*(_ROW_GETTER(vars(purchase)) for purchase in batch))]
+        async with self._conn.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(_EXECUTE_STMT, column_values)
 
     async def _get_connection(self):
-        return await connect(
+        """
+        :return: Пул соединений к БД; каждая пачка берет из него свое соединение
+        """
+        return await create_pool(
             host=settings.db_host,
             port=settings.db_port,
             database=settings.db_name,
             user=settings.db_user,
             password=settings.db_password,
             client_encoding='utf8',
+            minsize=settings.db_pool_min_size,
+            maxsize=settings.db_pool_max_size,
+            on_connect=_prepare_connection,
         )
 
     async def _close_connection(self):
-        await self._conn.close()
+        self._conn.close()
+        await self._conn.wait_closed()
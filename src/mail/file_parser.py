@@ -1,57 +1,231 @@
-from datetime import datetime
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import batched
 from io import BytesIO
 from pathlib import Path
-from typing import Type, Iterable
+from typing import Any, Type, Iterable, Iterator
 
-# np and pd are here just for dev speed, sorry
-import numpy as np
-import pandas as pd
+from openpyxl import load_workbook
+from pydantic import TypeAdapter
 from typing_extensions import TypeVar
 
 from src.amo.schemas import StatePurchase, DBStatePurchase
 
 T = TypeVar("T", bound=StatePurchase)
 
+logger = logging.getLogger(__name__)
+
+# Заголовки столбцов, которые читают модели (alias и варианты validation_alias)
+_MODEL_COLUMNS = frozenset(
+    name
+    for field in DBStatePurchase.model_fields.values()
+    for name in (
+        field.alias,
+        *getattr(field.validation_alias, 'choices', (field.validation_alias,)),
+    )
+    if isinstance(name, str)
+)
+
+_LIST_ADAPTERS: dict[type, TypeAdapter] = {}
+_PROCESS_POOL: ProcessPoolExecutor | None = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """
+    Процесс запускается через forkserver (spawn, где forkserver недоступен):
+    fork() многопоточного процесса (после asyncio.to_thread) может привести к взаимоблокировке в дочернем
+    :return: Пул процессов для разбора книг (создается при первом обращении)
+    """
+    global _PROCESS_POOL
+    if _PROCESS_POOL is None:
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _PROCESS_POOL = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context(start_method))
+    return _PROCESS_POOL
+
+
+def shutdown_process_pool(wait: bool = True) -> None:
+    """
+    Останавливает пул процессов разбора книг; следующий разбор создаст новый пул
+    :param wait: Дождаться завершения рабочего процесса
+    """
+    global _PROCESS_POOL
+    pool, _PROCESS_POOL = _PROCESS_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
 
 class ExcelParser:
+    _DATE_COLUMNS = ('Дата подведения итогов', 'Окончание контракта')
+    _DATE_FORMAT = "%d.%m.%Y"
+    _PURCHASE_NUMBER_COLUMN = 'Номер закупки'
+    _VALIDATE_CHUNK_SIZE = 1000
+
     def __init__(self, file: bytes, file_name: str) -> None:
-        self._df = pd.read_excel(BytesIO(file), dtype={'Номер закупки': np.str_})
+        self._file = file
         self.extraction_dt = self._get_datetime_from_file_name(file_name)
 
     async def parse(self) -> list[StatePurchase]:
         """
         :return: Список объектов `StatePurchase` для записи в Amo
         """
-        data = await self._get_records()
-        return await self._bulk_validate(StatePurchase, data)
+        return await self._parse_in_process(StatePurchase)
 
     async def parse_for_db(self) -> list[DBStatePurchase]:
         """
         :return: Список объектов `DBStatePurchase` для записи в БД
         """
-        data = await self._get_records()
-        data = [{**item, "extraction_dt": self.extraction_dt} for item in data]
-        return await self._bulk_validate(DBStatePurchase, data)
+        return await self._parse_in_process(DBStatePurchase, with_extraction_dt=True)
+
+    async def _parse_in_process(self, model: Type[T], with_extraction_dt: bool = False) -> list[T]:
+        """
+        Разбор книги - чисто вычислительная работа, поэтому выполняется в отдельном
+        процессе и не блокирует цикл событий (IMAP, БД, запросы к AmoCRM)
+        :param model: Модель, в которую преобразуются строки
+        :param with_extraction_dt: Добавить в каждую строку дату выгрузки файла
+        :return: Список объектов модели
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_process_pool(), self._parse_sync, model, with_extraction_dt)
+        except BrokenProcessPool:
+            # Рабочий процесс аварийно завершился (например, убит по OOM) - сломанный пул
+            # больше не принимает задачи, поэтому следующий разбор создаст новый
+            logger.error("Процесс разбора книги аварийно завершился, пул процессов будет пересоздан.")
+            shutdown_process_pool(wait=False)
+            raise
+
+    def _parse_sync(self, model: Type[T], with_extraction_dt: bool = False) -> list[T]:
+        """
+        :param model: Модель, в которую преобразуются строки
+        :param with_extraction_dt: Добавить в каждую строку дату выгрузки файла
+        :return: Список объектов модели
+        """
+        extra_fields = {"extraction_dt": self.extraction_dt} if with_extraction_dt else None
+        return self._bulk_validate(model, self._iter_records(extra_fields))
 
-    async def _get_records(self) -> list[dict]:
+    def _iter_records(self, extra_fields: dict[str, Any] | None = None) -> Iterator[dict]:
+        """
+        Читает первый лист книги построчно (openpyxl read_only), не строя
+        DataFrame и не загружая всю книгу в память. Строки отдаются по одной,
+        чтобы в памяти не копился полный список словарей
+        :param extra_fields: Поля, общие для всех строк (добавляются в словарь строки сразу при его создании)
+        :return: Словари, представляющие строки таблицы
+                 (только столбцы, которые читают модели)
+        """
+        workbook = load_workbook(BytesIO(self._file), read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            used_columns = [
+                (i, name) for i, name in enumerate(self._make_unique_columns(header))
+                if name in _MODEL_COLUMNS
+            ]
+            width = len(header)
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                if len(row) < width:
+                    row = (*row, *(None,) * (width - len(row)))
+                record = {name: row[i] for i, name in used_columns}
+                if extra_fields:
+                    record.update(extra_fields)
+                for col in self._DATE_COLUMNS:
+                    if col in record:
+                        record[col] = self._to_date(record[col])
+                if record.get(self._PURCHASE_NUMBER_COLUMN) is not None:
+                    record[self._PURCHASE_NUMBER_COLUMN] = self._to_str(record[self._PURCHASE_NUMBER_COLUMN])
+                yield record
+        finally:
+            workbook.close()
+
+    @classmethod
+    def _make_unique_columns(cls, header: Iterable[Any]) -> list[str]:
+        """
+        Именует столбцы так же, как pandas: пустые заголовки - 'Unnamed: N',
+        повторы получают суффиксы '.1', '.2' (например, 'ФИО 1.1')
+        :param header: Значения строки заголовков
+        :return: Список уникальных имен столбцов
+        """
+        columns = []
+        counts: dict[str, int] = {}
+        for i, name in enumerate(header):
+            name = f"Unnamed: {i}" if name is None else str(name)
+            base = name
+            count = counts.get(base, 0)
+            while name in counts:
+                count += 1
+                name = f"{base}.{count}"
+            counts[base] = count
+            counts[name] = 0
+            columns.append(name)
+        return columns
+
+    @classmethod
+    def _to_date(cls, value: Any) -> date | None:
+        """
+        :param value: Значение ячейки с датой (дата Excel или строка 'дд.мм.гггг')
+        :return: Дата или None, если значение не распознано
+        """
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if isinstance(value, str):
+            return cls._parse_date_string(value)
+        return None
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _parse_date_string(value: str) -> date | None:
+        """
+        Разбирает строку даты; результат кэшируется, т.к. одни и те же даты
+        повторяются во многих строках выгрузки
+        Строки ровно в формате 'дд.мм.гггг' разбираются срезами без strptime,
+        остальные варианты (например, без ведущих нулей) - через strptime
+        :param value: Строка вида 'дд.мм.гггг'
+        :return: Дата или None, если строка не распознана
+        """
+        value = value.strip()
+        try:
+            if len(value) == 10 and value[2] == value[5] == '.' and value.isascii() and value.replace('.', '').isdigit():
+                return date(int(value[6:]), int(value[3:5]), int(value[:2]))
+            return datetime.strptime(value, ExcelParser._DATE_FORMAT).date()
+        except ValueError:
+            return None
+
+    @classmethod
+    def _to_str(cls, value: Any) -> str:
         """
-        :return: Список словарей, представляющих строки таблицы
+        :param value: Значение ячейки
+        :return: Строковое представление; целые числа - без дробной части
         """
-        dt_cols = ('Дата подведения итогов', 'Окончание контракта')
-        for col in dt_cols:
-            self._df[col] = pd.to_datetime(self._df[col], format="%d.%m.%Y",
-                                                                errors='coerce').dt.date.replace({pd.NaT: None})
-        self._df.replace({np.nan: None}, inplace=True)
-        return self._df.to_dict(orient='records')
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
 
     @classmethod
-    async def _bulk_validate(cls, model: Type[T], items: Iterable[dict]) -> list[T]:
+    def _bulk_validate(cls, model: Type[T], items: Iterable[dict]) -> list[T]:
         """
         :param model: Модель, валидирующая словари
-        :param items: Список словарей к валидации
+        Валидирует словари пачками, чтобы одновременно в памяти находилась
+        только одна пачка исходных словарей
+        :param items: Словари к валидации
         :return: Список объектов модели
         """
-        return [model.model_validate(item) for item in items]
+        adapter = _LIST_ADAPTERS.get(model)
+        if adapter is None:
+            adapter = _LIST_ADAPTERS[model] = TypeAdapter(list[model])
+        result = []
+        for chunk in batched(items, cls._VALIDATE_CHUNK_SIZE):
+            result.extend(adapter.validate_python(chunk))
+        return result
 
     @classmethod
     def _get_datetime_from_file_name(cls, file_name: str) -> datetime:
@@ -1,21 +1,99 @@
 import logging
 import imaplib
+import json
+import os
 import email
+import re
+import base64
+import quopri
 from email.header import decode_header
-from typing import Optional
+from typing import Any, Optional
 import time
+import functools
+from datetime import date, timedelta
 import socket
+from itertools import takewhile
 
 
 from src.settings import settings
 
 logger = logging.getLogger(__name__)
 
+EXCEL_EXTENSIONS = ('.xlsx', '.xls', '.xlsm')
+_BODYSTRUCTURE_TOKEN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+_LITERAL_SUFFIX = re.compile(rb'\{\d+\}$')
+_IMAP_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _imap_retry(max_attempts: int = 2):
+    """
+    Повторяет IMAP-команду при обрыве соединения: перед каждой попыткой
+    проверяет/восстанавливает соединение, после последней неудачной попытки
+    пробрасывает исключение.
+    :param max_attempts: Максимальное число попыток
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            for attempt in range(1, max_attempts + 1):
+                self._ensure_connected()
+                try:
+                    return method(self, *args, **kwargs)
+                except (imaplib.IMAP4.error, socket.error, socket.timeout) as e:
+                    logger.error(f"Ошибка IMAP при выполнении {method.__name__} (попытка {attempt}): {e}")
+                    self.is_connected = False
+                    if attempt == max_attempts:
+                        logger.critical(f"IMAP команда не выполнена после {max_attempts} попыток.")
+                        raise
+                    logger.info("Попытка переподключения для повторного выполнения команды...")
+        return wrapper
+    return decorator
+
 
 class Gmail:
     def __init__(self):
         self.imap: Optional[imaplib.IMAP4_SSL] = None
         self.is_connected = False
+        self._uidvalidity: Optional[bytes] = None
+        self._last_processed_uid: Optional[int] = None
+        self.last_fetched_uid: Optional[int] = None
+        self._load_state()
+
+    def _load_state(self) -> None:
+        """
+        Восстанавливает UIDVALIDITY и UID последнего обработанного письма из файла
+        IMAP_STATE_FILE, чтобы после перезапуска не обрабатывать то же письмо повторно.
+        """
+        try:
+            with open(settings.IMAP_STATE_FILE, encoding='utf-8') as file:
+                state = json.load(file)
+            uidvalidity, last_processed_uid = state['uidvalidity'], state['last_processed_uid']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Не удалось прочитать состояние IMAP из {settings.IMAP_STATE_FILE}: {e}. Начинаем с нуля.")
+            return
+        self._uidvalidity = uidvalidity.encode() if uidvalidity is not None else None
+        self._last_processed_uid = int(last_processed_uid) if last_processed_uid is not None else None
+        logger.info(f"Восстановлено состояние IMAP: последний обработанный UID {self._last_processed_uid}.")
+
+    def _save_state(self) -> None:
+        """
+        Сохраняет UIDVALIDITY и UID последнего обработанного письма в IMAP_STATE_FILE.
+        Файл пишется через временный и заменяется атомарно.
+        """
+        state = {
+            'uidvalidity': self._uidvalidity.decode() if self._uidvalidity is not None else None,
+            'last_processed_uid': self._last_processed_uid,
+        }
+        tmp_path = f"{settings.IMAP_STATE_FILE}.tmp"
+        try:
+            os.makedirs(os.path.dirname(settings.IMAP_STATE_FILE) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(state, file)
+            os.replace(tmp_path, settings.IMAP_STATE_FILE)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить состояние IMAP в {settings.IMAP_STATE_FILE}: {e}")
 
     def _connect(self):
         """Устанавливает соединение и логинится на IMAP сервере."""
@@ -55,8 +133,19 @@ class Gmail:
             logger.error(f"Неожиданная ошибка при подключении к IMAP: {e}", exc_info=True)
 
     def _ensure_connected(self):
-        """Проверяет активность соединения и пытается переподключиться при необходимости."""
+        """
+        Проверяет активность соединения и пытается переподключиться при необходимости.
+        Живое соединение проверяется дешевой командой NOOP, переподключение
+        выполняется только если сервер разорвал сессию.
+        """
         try:
+            if self.is_connected and self.imap is not None and self.imap.state not in ('LOGOUT', 'NONAUTH'):
+                try:
+                    self.imap.noop()
+                except (imaplib.IMAP4.abort, socket.error, socket.timeout) as e:
+                    logger.warning(f"IMAP соединение разорвано (NOOP не прошел): {e}")
+                    self.is_connected = False
+
             if not self.is_connected or self.imap is None or self.imap.state in ('LOGOUT', 'NONAUTH'):
                 logger.info("IMAP соединение неактивно или в некорректном состоянии. Попытка переподключения...")
                 self._connect()
@@ -82,6 +171,56 @@ class Gmail:
             self.imap = None
             raise
 
+    @_imap_retry()
+    def _search_new_messages(self) -> list[int]:
+        """
+        Выбирает папку "Входящие" (если еще не выбрана) и ищет письма новее последнего обработанного.
+        :return: Список UID найденных писем
+        """
+        if self.imap.state != 'SELECTED':
+            logger.info("Выполнение команды IMAP: SELECT INBOX")
+            status, messages = self.imap.select("INBOX")
+            self._check_status(status, messages, "SELECT INBOX")
+            _, uidvalidity = self.imap.response('UIDVALIDITY')
+            uidvalidity = uidvalidity[0] if uidvalidity else None
+            if uidvalidity != self._uidvalidity:
+                if self._uidvalidity is not None:
+                    logger.warning("UIDVALIDITY папки Входящие изменился. Сбрасываем последний обработанный UID.")
+                self._uidvalidity = uidvalidity
+                self._last_processed_uid = None
+
+        search_criteria = self._build_search_criteria(
+            self._last_processed_uid + 1 if self._last_processed_uid is not None else None
+        )
+        logger.info(f"Выполнение команды IMAP: SEARCH {search_criteria}")
+        status, messages = self.imap.uid('SEARCH', None, search_criteria)
+        self._check_status(status, messages, f"SEARCH {search_criteria}")
+        return [int(uid) for uid in messages[0].split()] if messages and messages[0] else []
+
+    @_imap_retry()
+    def _uid_fetch(self, uid: str, message_parts: str) -> list:
+        """
+        :param uid: UID сообщения
+        :param message_parts: Запрашиваемые элементы, например "(BODYSTRUCTURE)"
+        :return: Данные ответа FETCH
+        """
+        logger.info(f"Выполнение команды IMAP: FETCH {uid} {message_parts}")
+        status, data = self.imap.uid('FETCH', uid, message_parts)
+        self._check_status(status, data, f"FETCH {uid} {message_parts}")
+        return data
+
+    def _check_status(self, status: str, data: Any, command: str) -> None:
+        """
+        Помечает соединение неактивным и бросает IMAP4.abort, если команда завершилась не OK.
+        :param status: Статус ответа сервера
+        :param data: Данные ответа (для лога)
+        :param command: Текст команды (для лога)
+        """
+        if status != "OK":
+            logger.error(f"IMAP {command} failed: Status {status}, Data {data}")
+            self.is_connected = False
+            raise imaplib.IMAP4.abort(f"command: {command} => Status {status}")
+
     def get_most_recent_file(self) -> tuple[bytes, str] | None:
         """
         Получает содержимое и имя самого последнего вложения Excel из папки "Входящие".
@@ -89,154 +228,227 @@ class Gmail:
         :return: Кортеж содержимого файла (bytes) и его имени (str), или None.
         """
         try:
-            self._ensure_connected()
-
-            if not self.is_connected or self.imap is None:
-                logger.error("Не удалось выполнить команду GET_MOST_RECENT_FILE: IMAP клиент не подключен после попыток восстановления.")
+            message_uids = self._search_new_messages()
+            if not message_uids:
+                logger.info("Нет сообщений в папке Входящие для обработки.")
                 return None
 
-            max_command_retries = 2
-            for attempt in range(max_command_retries):
-                try:
-                    if not self.is_connected or self.imap is None or self.imap.state in ('LOGOUT', 'NONAUTH'):
-                        self._ensure_connected()
-                        if not self.is_connected or self.imap is None:
-                            logger.error(f"Переподключение не удалось перед выполнением команды (попытка {attempt + 1}). Пропуск команды.")
-                            if attempt < max_command_retries - 1:
-                                continue
-                            else:
-                                logger.critical(f"Не удалось выполнить команду IMAP после {max_command_retries} попыток.")
-                                raise ConnectionError("Не удалось выполнить IMAP команду: соединение не активно.")
-
-                    logger.info(f"Выполнение команды IMAP: SELECT INBOX (попытка {attempt + 1})")
-                    status, messages = self.imap.select("INBOX")
-                    if status != "OK":
-                        logger.error(f"IMAP SELECT INBOX failed: Status {status}, Messages {messages}")
-                        self.is_connected = False
-                        if attempt < max_command_retries - 1:
-                            continue
-                        else:
-                            raise imaplib.IMAP4.abort(f"command: SELECT => Status {status}")
-
-                    logger.info(f"Выполнение команды IMAP: SEARCH ALL (попытка {attempt + 1})")
-                    status, messages = self.imap.search(None, "ALL")
-                    if status != "OK":
-                        logger.error(f"IMAP SEARCH ALL failed: Status {status}, Messages {messages}")
-                        self.is_connected = False
-                        if attempt < max_command_retries - 1:
-                            continue
-                        else:
-                            raise imaplib.IMAP4.abort(f"command: SEARCH ALL => Status {status}")
-
-                    break
+            latest_uid = max(message_uids)
+            if self._last_processed_uid is not None and latest_uid <= self._last_processed_uid:
+                logger.info(f"Новых писем нет (последний обработанный UID: {self._last_processed_uid}).")
+                return None
 
-                except (imaplib.IMAP4.error, socket.error, socket.timeout) as e:
-                    logger.error(f"Ошибка IMAP при выполнении команды (попытка {attempt + 1}): {e}")
-                    self.is_connected = False
-                    if attempt < max_command_retries - 1:
-                        logger.info("Попытка переподключения для повторного выполнения команды...")
-                        continue
-                    else:
-                        logger.critical(f"IMAP команда не выполнена после {max_command_retries} попыток.")
-                        raise
+            latest_message_id = str(latest_uid)
+            self.last_fetched_uid = latest_uid
+            logger.info(f"Найдены письма. Получение последнего сообщения (UID: {latest_message_id})...")
 
-                except Exception as e:
-                    logger.error(f"Неожиданная ошибка при выполнении IMAP команды (попытка {attempt + 1}): {e}", exc_info=True)
-                    raise
+            msg_data = self._uid_fetch(latest_message_id, "(BODYSTRUCTURE)")
+            if not msg_data or not msg_data[0]:
+                logger.error(f"Не получены данные сообщения для ID {latest_message_id} после FETCH.")
+                return None
 
-            if messages and messages[0]:
-                message_ids = messages[0].decode('utf-8').split()
-                if not message_ids:
-                    logger.info("Нет писем в папке Входящие.")
-                    return None
+            try:
+                attachment = self._find_excel_attachment(msg_data)
+            except Exception as e:
+                logger.warning(f"Не удалось разобрать BODYSTRUCTURE сообщения {latest_message_id}: {e}. Загружаем письмо целиком.")
+                return self._fetch_excel_from_full_message(latest_message_id)
+
+            if attachment is None:
+                logger.info(f"Последнее сообщение (ID: {latest_message_id}) не содержит вложений Excel с нужным расширением.")
+                self.mark_processed()
+                return None
 
-                latest_message_id = message_ids[-1]
-                logger.info(f"Найдены письма. Получение последнего сообщения (ID: {latest_message_id})...")
+            part_number, encoding, filename = attachment
+            part_data = self._uid_fetch(latest_message_id, f"(BODY.PEEK[{part_number}])")
+            if not part_data or not isinstance(part_data[0], tuple):
+                logger.error(f"IMAP FETCH части {part_number} не вернул данных для ID {latest_message_id}")
+                return None
+            data = self._decode_part_payload(part_data[0][1], encoding)
+            logger.info(f"Найдено и извлечено вложение Excel: {filename}")
+            return data, filename
 
-                for attempt in range(max_command_retries):
-                    try:
-                        if not self.is_connected or self.imap is None or self.imap.state in ('LOGOUT', 'NONAUTH'):
-                           self._ensure_connected()
-                           if not self.is_connected or self.imap is None:
-                                logger.error(f"Переподключение не удалось перед выполнением FETCH (попытка {attempt + 1}).")
-                                if attempt < max_command_retries - 1:
-                                    continue
-                                else:
-                                    raise ConnectionError("Не удалось выполнить FETCH: соединение не активно.")
-
-                        logger.info(f"Выполнение команды IMAP: FETCH {latest_message_id} (RFC822) (попытка {attempt + 1})")
-                        status, msg_data = self.imap.fetch(latest_message_id, "(RFC822)")
-                        if status != "OK":
-                            logger.error(f"IMAP FETCH failed for message ID {latest_message_id}: Status {status}, Data {msg_data}")
-                            self.is_connected = False
-                            if attempt < max_command_retries - 1:
-                                continue
-                            else:
-                                raise imaplib.IMAP4.abort(f"command: FETCH => Status {status}")
-
-                        break
-
-                    except (imaplib.IMAP4.error, socket.error, socket.timeout) as e:
-                        logger.error(f"Ошибка IMAP при выполнении FETCH (попытка {attempt + 1}): {e}")
-                        self.is_connected = False
-                        if attempt < max_command_retries - 1:
-                            logger.info("Попытка переподключения для повторного выполнения FETCH...")
-                            continue
-                        else:
-                            logger.critical(f"IMAP FETCH не выполнен после {max_command_retries} попыток.")
-                            raise
-
-                    except Exception as e:
-                        logger.error(f"Неожиданная ошибка при выполнении FETCH (попытка {attempt + 1}): {e}", exc_info=True)
-                        raise
+        except ConnectionError as e:
+            logger.critical(f"Не удалось получить файл из Gmail: Ошибка соединения после нескольких попыток: {e}")
+            return None
 
-                if not msg_data or not msg_data[0]:
-                    logger.error(f"Не получены данные сообщения для ID {latest_message_id} после FETCH.")
-                    return None
+        except Exception as e:
+            logger.error(f"Непредвиденная ошибка в get_most_recent_file: {e}", exc_info=True)
+            return None
 
-                try:
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    logger.debug(f"Парсинг сообщения от {msg.get('From')}, Тема: {decode_header(msg.get('Subject', 'Н/Д'))[0][0]}")
-
-                    for part in msg.walk():
-                        if part.get_content_disposition() == "attachment":
-                            filename = part.get_filename()
-                            if filename:
-                                try:
-                                    decoded_filename_tuple = decode_header(filename)[0]
-                                    decoded_filename = decoded_filename_tuple[0]
-                                    if isinstance(decoded_filename, bytes):
-                                        encoding = decoded_filename_tuple[1] or 'utf-8'
-                                        decoded_filename = decoded_filename.decode(encoding)
-                                    filename = decoded_filename
-                                except Exception as e:
-                                    logger.warning(f"Не удалось декодировать имя файла '{filename}': {e}. Используется исходное имя.")
-
-                                data = part.get_payload(decode=True)
-
-                                if filename.lower().endswith(('.xlsx', '.xls', '.xlsm')):
-                                    logger.info(f"Найдено и извлечено вложение Excel: {filename}")
-                                    return data, filename
-
-                    logger.info(f"Последнее сообщение (ID: {latest_message_id}) не содержит вложений Excel с нужным расширением.")
-                    return None
-
-                except Exception as e:
-                    logger.error(f"Ошибка при парсинге сообщения или извлечении вложений для ID {latest_message_id}: {e}", exc_info=True)
-                    return None
+    def mark_processed(self) -> None:
+        """
+        Запоминает UID последнего полученного письма как обработанный:
+        следующие вызовы get_most_recent_file вернут файл только из более нового письма.
+        Вызывается после успешной обработки файла, чтобы при ошибке письмо было взято повторно.
+        """
+        if self.last_fetched_uid is not None:
+            self._last_processed_uid = self.last_fetched_uid
+            self._save_state()
 
-            else:
-                logger.info("Нет сообщений в папке Входящие для обработки.")
+    @staticmethod
+    def _build_search_criteria(min_uid: Optional[int] = None) -> str:
+        """
+        Формирует критерии IMAP SEARCH: только письма за последние
+        IMAP_SEARCH_SINCE_DAYS дней, с UID не меньше min_uid и, если задан, от IMAP_SEARCH_FROM.
+        Месяц пишется по-английски вручную, чтобы не зависеть от локали strftime.
+        :param min_uid: Минимальный UID письма
+        :return: Строка критериев поиска
+        """
+        criteria = []
+        if min_uid is not None:
+            criteria.append(f"UID {min_uid}:*")
+        if settings.IMAP_SEARCH_SINCE_DAYS > 0:
+            since = date.today() - timedelta(days=settings.IMAP_SEARCH_SINCE_DAYS)
+            criteria.append(f"SINCE {since.day:02d}-{_IMAP_MONTHS[since.month - 1]}-{since.year}")
+        if settings.IMAP_SEARCH_FROM:
+            criteria.append(f'FROM "{settings.IMAP_SEARCH_FROM}"')
+        return f"({' '.join(criteria)})" if criteria else "ALL"
+
+    def _fetch_excel_from_full_message(self, message_id: str) -> tuple[bytes, str] | None:
+        """
+        Загружает письмо целиком (BODY.PEEK[], не помечая его прочитанным)
+        и ищет в нем вложение Excel. Используется, если BODYSTRUCTURE не удалось разобрать.
+        :param message_id: UID сообщения
+        :return: Кортеж содержимого файла (bytes) и его имени (str), или None.
+        """
+        try:
+            msg_data = self._uid_fetch(message_id, "(BODY.PEEK[])")
+            if not msg_data or not msg_data[0]:
+                logger.error(f"Не получены данные сообщения для ID {message_id} после FETCH.")
                 return None
 
-        except ConnectionError as e:
-            logger.critical(f"Не удалось получить файл из Gmail: Ошибка соединения после нескольких попыток: {e}")
+            msg = email.message_from_bytes(msg_data[0][1])
+            logger.debug(f"Парсинг сообщения от {msg.get('From')}, Тема: {decode_header(msg.get('Subject', 'Н/Д'))[0][0]}")
+
+            for part in msg.walk():
+                if part.get_content_maintype() != "application" or part.get_content_disposition() != "attachment":
+                    continue
+                filename = part.get_filename()
+                if not filename:
+                    continue
+                filename = self._decode_filename(filename)
+                if not filename.lower().endswith(EXCEL_EXTENSIONS):
+                    continue
+
+                data = part.get_payload(decode=True)
+                logger.info(f"Найдено и извлечено вложение Excel: {filename}")
+                return data, filename
+
+            logger.info(f"Последнее сообщение (ID: {message_id}) не содержит вложений Excel с нужным расширением.")
+            self.mark_processed()
             return None
 
         except Exception as e:
-            logger.error(f"Непредвиденная ошибка в get_most_recent_file: {e}", exc_info=True)
+            logger.error(f"Ошибка при парсинге сообщения или извлечении вложений для ID {message_id}: {e}", exc_info=True)
             return None
 
+    @staticmethod
+    def _decode_filename(filename: str) -> str:
+        """
+        Декодирует имя файла из MIME encoded-word (=?UTF-8?B?...?=).
+        :param filename: Исходное имя файла
+        :return: Декодированное имя или исходное, если декодировать не удалось
+        """
+        try:
+            decoded_filename, encoding = decode_header(filename)[0]
+            if isinstance(decoded_filename, bytes):
+                decoded_filename = decoded_filename.decode(encoding or 'utf-8')
+            return decoded_filename
+        except Exception as e:
+            logger.warning(f"Не удалось декодировать имя файла '{filename}': {e}. Используется исходное имя.")
+            return filename
+
+    @staticmethod
+    def _decode_part_payload(payload: bytes, encoding: Optional[str]) -> bytes:
+        """
+        :param payload: Тело MIME-части в том виде, в каком его вернул сервер
+        :param encoding: Content-Transfer-Encoding части
+        :return: Декодированное содержимое
+        """
+        encoding = (encoding or '').lower()
+        if encoding == 'base64':
+            return base64.b64decode(payload)
+        if encoding == 'quoted-printable':
+            return quopri.decodestring(payload)
+        return payload
+
+    @staticmethod
+    def _parse_bodystructure(fetch_data: list) -> Any:
+        """
+        Разбирает ответ FETCH (BODYSTRUCTURE) во вложенные списки.
+        Строки в кавычках и атомы становятся str, NIL - None.
+        Литералы ({n}) подставляются как обычные строки.
+        :param fetch_data: Ответ imaplib на FETCH
+        :return: Структура тела письма
+        """
+        raw = b''
+        for item in fetch_data:
+            if isinstance(item, tuple):
+                prefix, literal = item
+                raw += _LITERAL_SUFFIX.sub(b'', prefix.rstrip())
+                raw += b'"' + literal.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+            elif item:
+                raw += item
+
+        stack: list[list] = [[]]
+        for token in _BODYSTRUCTURE_TOKEN.findall(raw):
+            if token == b'(':
+                stack.append([])
+            elif token == b')':
+                closed = stack.pop()
+                stack[-1].append(closed)
+            elif token.startswith(b'"'):
+                stack[-1].append(re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode('utf-8', 'replace'))
+            elif token.upper() == b'NIL':
+                stack[-1].append(None)
+            else:
+                stack[-1].append(token.decode('ascii', 'replace'))
+
+        response = stack[0][-1]
+        for key, value in zip(response[::2], response[1::2]):
+            if isinstance(key, str) and key.upper() == 'BODYSTRUCTURE':
+                return value
+        raise ValueError("BODYSTRUCTURE отсутствует в ответе сервера")
+
+    @classmethod
+    def _find_excel_attachment(cls, fetch_data: list) -> tuple[str, Optional[str], str] | None:
+        """
+        Находит в BODYSTRUCTURE первую часть-вложение Excel.
+        :param fetch_data: Ответ imaplib на FETCH (BODYSTRUCTURE)
+        :return: Кортеж (номер части, Content-Transfer-Encoding, имя файла) или None
+        """
+        def params_to_dict(params: Any) -> dict[str, str]:
+            if not isinstance(params, list):
+                return {}
+            return {
+                str(key).lower(): value
+                for key, value in zip(params[::2], params[1::2])
+                if isinstance(value, str)
+            }
+
+        def walk(body: list, path: list[int]):
+            if body and isinstance(body[0], list):
+                for index, child in enumerate(takewhile(lambda item: isinstance(item, list), body), start=1):
+                    yield from walk(child, path + [index])
+                return
+            yield '.'.join(map(str, path or [1])), body
+
+        for part_number, body in walk(cls._parse_bodystructure(fetch_data), []):
+            disposition = next(
+                (item for item in body[7:] if isinstance(item, list) and len(item) == 2
+                 and isinstance(item[0], str) and item[0].lower() in ('attachment', 'inline')),
+                None
+            )
+            if disposition is None or disposition[0].lower() != 'attachment':
+                continue
+            filename = params_to_dict(disposition[1]).get('filename') or params_to_dict(body[2]).get('name')
+            if not filename:
+                continue
+            filename = cls._decode_filename(filename)
+            if filename.lower().endswith(EXCEL_EXTENSIONS):
+                return part_number, body[5], filename
+        return None
+
     def logout(self):
         """Выполняет выход из IMAP сервера, если соединение активно."""
         if self.imap and self.is_connected:
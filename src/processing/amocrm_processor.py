@@ -1,6 +1,12 @@
+import asyncio
+import contextlib
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import date, datetime, timezone, timedelta
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from operator import attrgetter
+from typing import List, Dict, Any, Optional, Awaitable, Callable, Iterable, FrozenSet, get_args
+from datetime import date, datetime
 
 from src.amo.client import AmoClient
 from src.amo.schemas import DBStatePurchase
@@ -8,6 +14,8 @@ from src.settings import settings
 
 logger = logging.getLogger(__name__)
 
+_PROGRESS_LOG_EVERY = 100
+
 
 def format_value(value: Any) -> str:
     """
@@ -20,12 +28,8 @@ def format_value(value: Any) -> str:
         числа без десятичных знаков если целое или с двумя знаками после запятой,
         остальные типы преобразуются в строку).
     """
-    if value is None:
-        return "не указано"
-    if isinstance(value, date): return value.strftime('%d.%m.%Y')
-    if isinstance(value, (float, int)):
-        return str(int(value)) if float(value).is_integer() else f"{float(value):.2f}"
-    return str(value)
+    formatter = _VALUE_FORMATTERS.get(type(value))
+    return formatter(value) if formatter else str(value)
 
 
 def format_number_with_spaces(number_str: str) -> str:
@@ -53,6 +57,80 @@ def format_number_with_spaces(number_str: str) -> str:
     return result + " р."
 
 
+def _format_money(value: Optional[float]) -> str:
+    return "не указано" if value is None else format_number_with_spaces(str(value))
+
+
+def _format_text(value: Any) -> str:
+    return "не указано" if value is None else str(value)
+
+
+def _format_date(value: Optional[date]) -> str:
+    return "не указано" if value is None else value.strftime('%d.%m.%Y')
+
+
+def _format_number(value: Optional[float]) -> str:
+    if value is None:
+        return "не указано"
+    return str(int(value)) if float(value).is_integer() else f"{float(value):.2f}"
+
+
+# Форматтеры format_value по точному типу значения (без цепочки isinstance)
+_VALUE_FORMATTERS: Dict[type, Callable[[Any], str]] = {
+    type(None): _format_text,
+    date: _format_date,
+    datetime: _format_date,
+    int: _format_number,
+    float: _format_number,
+    bool: _format_number,
+}
+
+
+def _formatter_for(annotation: Any) -> Callable[[Any], str]:
+    """
+    Подбирает форматтер по аннотации поля модели, чтобы не проверять тип значения при каждом вызове.
+
+    Args:
+        annotation: Аннотация поля (например, Optional[date]).
+    Returns:
+        Функция, форматирующая значение поля так же, как format_value.
+    """
+    types = get_args(annotation) or (annotation,)
+    if date in types:
+        return _format_date
+    if float in types or int in types:
+        return _format_number
+    return _format_text
+
+
+_FIELD_FORMATTERS: Dict[str, Callable[[Any], str]] = {
+    name: _formatter_for(field.annotation) for name, field in DBStatePurchase.model_fields.items()
+}
+
+# (подпись, атрибут DBStatePurchase, форматтер) в порядке вывода в примечании
+_NOTE_FIELDS = (
+    ("Ссылка на закупку", "eis_url", _FIELD_FORMATTERS["eis_url"]),
+    ("Наименование победителя", "winner_name", _FIELD_FORMATTERS["winner_name"]),
+    ("ИНН", "inn", _FIELD_FORMATTERS["inn"]),
+    ("Дата итогов", "result_date", _FIELD_FORMATTERS["result_date"]),
+    ("Наименование заказчика", "customer_name", _FIELD_FORMATTERS["customer_name"]),
+    ("НМЦК", "nmck", _format_money),
+    ("Обеспечение контракта", "contract_securing", _format_money),
+    ("Обеспечение гарантийных обязательств", "warranty_obligations_securing", _format_money),
+    ("Окончание контракта", "contract_end_date", _FIELD_FORMATTERS["contract_end_date"]),
+    ("Цена победителя", "winner_price", _format_money),
+)
+_NOTE_SMP_FIELDS = (
+    ("Преимущества СМП", "smp_advantages", _FIELD_FORMATTERS["smp_advantages"]),
+    ("Статус СМП", "smp_status", _FIELD_FORMATTERS["smp_status"]),
+)
+_CONTACT_GETTERS = tuple((i, attrgetter(f'fio_{i}', f'phone_{i}', f'email_{i}')) for i in range(1, 4))
+
+# Шаблоны примечания собираются один раз из таблиц полей; значения подставляются через format_map
+_NOTE_HEAD_TEMPLATE = "\n".join(f"{label}: {{{attr}}}" for label, attr, _ in _NOTE_FIELDS)
+_NOTE_SMP_TEMPLATE = "\n".join(f"{label}: {{{attr}}}" for label, attr, _ in _NOTE_SMP_FIELDS)
+
+
 def generate_note_text_for_win(purchase_data: DBStatePurchase) -> str:
     """
     Генерирует форматированный текст примечания для сделки о выигрыше в закупке.
@@ -62,55 +140,153 @@ def generate_note_text_for_win(purchase_data: DBStatePurchase) -> str:
     Returns:
         Многострочная строка, содержащая информацию о закупке и победителе.
     """
-    note_lines = [
-        f"Ссылка на закупку: {format_value(purchase_data.eis_url)}",
-        f"Наименование победителя: {format_value(purchase_data.winner_name)}",
-        f"ИНН: {format_value(purchase_data.inn)}",
-        f"Дата итогов: {format_value(purchase_data.result_date)}",
-        f"Наименование заказчика: {format_value(purchase_data.customer_name)}",
-        f"НМЦК: {format_number_with_spaces(str(purchase_data.nmck))}",
-        f"Обеспечение контракта: {format_number_with_spaces(str(purchase_data.contract_securing))}",
-        f"Обеспечение гарантийных обязательств: {format_number_with_spaces(str(purchase_data.warranty_obligations_securing))}",
-        f"Окончание контракта: {format_value(purchase_data.contract_end_date)}",
-        f"Цена победителя: {format_number_with_spaces(str(purchase_data.winner_price))}"
-    ]
+    values = vars(purchase_data)
     contact_details_lines = []
-    for i in range(1, 4):
-        fio = getattr(purchase_data, f'fio_{i}', None)
-        phone = getattr(purchase_data, f'phone_{i}', None)
-        email = getattr(purchase_data, f'email_{i}', None)
+    for i, get_contact in _CONTACT_GETTERS:
+        fio, phone, email = get_contact(purchase_data)
         if fio or phone or email:
             contact_details_lines.append(
-                f"  - Контакт {i}: ФИО: {format_value(fio)}, Телефон: {format_value(phone)}, Email: {format_value(email)}"
+                f"  - Контакт {i}: ФИО: {_format_text(fio)}, Телефон: {_format_text(phone)}, Email: {_format_text(email)}"
             )
     if contact_details_lines:
-        note_lines.append("Контактные данные:")
-        note_lines.extend(contact_details_lines)
+        contacts = "Контактные данные:\n" + "\n".join(contact_details_lines)
     else:
-        note_lines.append("Контактные данные: не указаны")
-    note_lines.extend([
-        f"Преимущества СМП: {format_value(purchase_data.smp_advantages)}",
-        f"Статус СМП: {format_value(purchase_data.smp_status)}"
-    ])
-    return "\n".join(note_lines)
+        contacts = "Контактные данные: не указаны"
+    return "\n".join((
+        _NOTE_HEAD_TEMPLATE.format_map({attr: formatter(values[attr]) for _, attr, formatter in _NOTE_FIELDS}),
+        contacts,
+        _NOTE_SMP_TEMPLATE.format_map({attr: formatter(values[attr]) for _, attr, formatter in _NOTE_SMP_FIELDS}),
+    ))
+
+
+class _PendingWrites:
+    """
+    Накопитель обновлений сделок, примечаний и задач: вместо отдельного запроса
+    на каждую запись они отправляются пакетами через bulk-методы AmoClient.
+    """
+    FLUSH_SIZE = 200
+
+    def __init__(self, amo_client: AmoClient):
+        """
+        Args:
+            amo_client: Экземпляр клиента AmoClient.
+        """
+        self._amo_client = amo_client
+        # Обновления по ID сделки: повторное обновление той же сделки дополняет предыдущее
+        self._lead_updates: Dict[int, Dict[str, Any]] = {}
+        self._notes: List[Dict[str, Any]] = []
+        self._tasks: List[Dict[str, Any]] = []
+
+    async def add_lead_update(self, lead_id: int, **fields: Any) -> None:
+        """
+        Ставит обновление сделки в очередь; при заполнении пакета отправляет его.
+        Обновления одной сделки объединяются (для одинаковых полей побеждает последнее значение),
+        чтобы в пакете не было нескольких элементов с одним ID.
+        Args:
+            lead_id: ID сделки.
+            **fields: Аргументы AmoClient.update_lead.
+        """
+        self._lead_updates[lead_id] = {**self._lead_updates.get(lead_id, {}), "lead_id": lead_id, **fields}
+        if len(self._lead_updates) >= self.FLUSH_SIZE:
+            await self._flush_lead_updates()
+
+    async def add_note(self, lead_id: int, text: str) -> None:
+        """
+        Ставит примечание в очередь; при заполнении пакета отправляет его.
+        Args:
+            lead_id: ID сделки.
+            text: Текст примечания.
+        """
+        self._notes.append({"lead_id": lead_id, "text": text})
+        if len(self._notes) >= self.FLUSH_SIZE:
+            await self._flush_notes()
+
+    async def add_task(self, **task: Any) -> None:
+        """
+        Ставит задачу в очередь; при заполнении пакета отправляет его.
+        Args:
+            **task: Аргументы AmoClient.create_task.
+        """
+        self._tasks.append(task)
+        if len(self._tasks) >= self.FLUSH_SIZE:
+            await self._flush_tasks()
+
+    async def flush(self) -> None:
+        """
+        Отправляет все накопленные обновления, примечания и задачи.
+        """
+        await asyncio.gather(self._flush_lead_updates(), self._flush_notes(), self._flush_tasks())
+
+    async def _flush_lead_updates(self) -> None:
+        batch, self._lead_updates = list(self._lead_updates.values()), {}
+        await self._send(batch, self._amo_client.update_leads_bulk, "Не удалось обновить сделку ID {lead_id}.")
+
+    async def _flush_notes(self) -> None:
+        batch, self._notes = self._notes, []
+        await self._send(batch, self._amo_client.add_notes_to_leads_bulk, "Не удалось добавить примечание к сделке ID {lead_id}.")
+
+    async def _flush_tasks(self) -> None:
+        batch, self._tasks = self._tasks, []
+        await self._send(
+            batch, self._amo_client.create_tasks_bulk,
+            "Не удалось создать задачу для сделки ID {entity_id} (исполнитель ID {responsible_user_id}).",
+            success_message="Задача успешно создана для сделки ID {entity_id} и назначена пользователю ID {responsible_user_id}."
+        )
+
+    @staticmethod
+    async def _send(
+        batch: List[Dict[str, Any]],
+        bulk_method: Callable[[List[Dict[str, Any]]], Awaitable[List[Optional[Dict[str, Any]]]]],
+        error_message: str,
+        success_message: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            batch: Накопленные элементы.
+            bulk_method: Пакетный метод AmoClient для их отправки.
+            error_message: Шаблон сообщения об ошибке, заполняется полями элемента.
+            success_message: Шаблон сообщения об успешной отправке элемента (если нужен).
+        """
+        if not batch:
+            return
+        results = await bulk_method(batch)
+        for item, result in zip(batch, results):
+            if not result:
+                logger.error(error_message.format(**item))
+            elif success_message:
+                logger.info(success_message.format(**item))
+
+
+@dataclass
+class _InnResolution:
+    """
+    Компания и сделка, найденные или созданные для одного ИНН в рамках прогона.
+    Следующие закупки с тем же ИНН берут их отсюда, не повторяя поиск в amoCRM.
+    """
+    company_resolved: bool = False
+    company_excluded: bool = False
+    company_id: Optional[int] = None
+    company_responsible_user_id: Optional[int] = None
+    lead: Optional[Dict[str, Any]] = None
+    company_linked: bool = False
 
 
 async def _create_task(
-    amo_client: AmoClient,
+    pending_writes: _PendingWrites,
     lead_id: int,
-    lead_info: Dict[str, Any],
+    responsible_user_id: Optional[int],
     is_new_lead: bool,
     purchase_number: str,
     id_user_anastasia_popova: Optional[int],
     id_user_unsorted: Optional[int]
 ):
     """
-    Создает задачу в AmoCRM для сделки.
+    Определяет исполнителя и ставит задачу по сделке в очередь на пакетное создание.
 
     Args:
-        amo_client: Экземпляр клиента AmoClient.
+        pending_writes: Накопитель пакетных записей в amoCRM.
         lead_id: ID сделки, к которой привязана задача.
-        lead_info: Словарь с информацией о сделке.
+        responsible_user_id: ID текущего ответственного сделки (уже известен вызывающему коду).
         is_new_lead: Флаг, указывающий, является ли сделка новой.
         purchase_number: Номер закупки для текста задачи.
         id_user_anastasia_popova: ID пользователя "Анастасия Попова".
@@ -118,9 +294,8 @@ async def _create_task(
     Returns:
         None.
     """
-    responsible_user_id = lead_info.get('responsible_user_id')
     task_text = f"Пришло обновление из базы победителей."
-    complete_till_timestamp = int((datetime.now(timezone.utc) + timedelta(minutes=settings.TASK_COMPLETE_OFFSET_MINUTES)).timestamp())
+    complete_till_timestamp = int(time.time()) + settings.TASK_COMPLETE_OFFSET_MINUTES * 60
 
     if not responsible_user_id:
         logger.warning(f"Для сделки ID {lead_id} не найден ответственный. Задача не будет создана.")
@@ -145,97 +320,155 @@ async def _create_task(
 
     task_type_name = settings.TASK_TYPE_NAME_DEFAULT
 
-    if await amo_client.create_task(
+    await pending_writes.add_task(
         entity_id=lead_id,
         responsible_user_id=task_assigned_to_id,
         text=task_text,
         complete_till_timestamp=complete_till_timestamp,
         entity_type="leads",
         task_type_name=task_type_name
-    ):
-        logger.info(f"Задача успешно создана для сделки ID {lead_id} и назначена пользователю ID {task_assigned_to_id}.")
-    else:
-        logger.error(f"Не удалось создать задачу для сделки ID {lead_id}.")
+    )
+    logger.debug(f"Задача для сделки ID {lead_id} поставлена в очередь и будет назначена пользователю ID {task_assigned_to_id}.")
+
+
+async def _discard_task(task: asyncio.Task) -> None:
+    """
+    Отменяет ставшую ненужной фоновую задачу. Результат уже завершенной задачи забирается,
+    чтобы ее исключение не попало в лог как "Task exception was never retrieved".
+
+    Args:
+        task: Фоновая задача.
+    Returns:
+        None.
+    """
+    if task.done():
+        if not task.cancelled():
+            task.exception()
+        return
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+def _is_eligible(purchase_data: DBStatePurchase) -> bool:
+    """
+    Проверяет, нужно ли обрабатывать закупку в amoCRM (достаточный бюджет и известен победитель).
+
+    Args:
+        purchase_data: Объект DBStatePurchase с данными о закупке.
+    Returns:
+        True, если закупка подлежит обработке.
+    """
+    if purchase_data.contract_securing is None or purchase_data.contract_securing < settings.MIN_LEAD_BUDGET:
+        logger.debug(f"Пропуск (бюджет < {settings.MIN_LEAD_BUDGET}): '{purchase_data.winner_name}' ({purchase_data.purchase_number}), бюджет {purchase_data.contract_securing}")
+        return False
+    if not purchase_data.winner_name:
+        logger.warning(f"Пропуск (нет имени победителя): закупка '{purchase_data.purchase_number}'")
+        return False
+    return True
 
 
 async def _handle_lead_processing(
     amo_client: AmoClient,
+    pending_writes: _PendingWrites,
     purchase_data: DBStatePurchase,
     pipeline_id: int,
     target_status_id: int,
-    exclude_user_ids_for_creation_filter: List[int],
+    exclude_user_ids_for_creation_filter: FrozenSet[int],
     id_user_anastasia_popova: Optional[int],
-    id_user_unsorted: Optional[int]
+    id_user_unsorted: Optional[int],
+    resolution: Optional[_InnResolution] = None
 ):
     """
-    Обрабатывает одну запись о закупке: ищет существующую сделку, создает новую при необходимости,
+    Обрабатывает одну запись о закупке, прошедшую _is_eligible: ищет существующую сделку, создает новую при необходимости,
     создает или находит компанию, привязывает компанию к сделке, добавляет примечание и создает задачу.
 
     Args:
         amo_client: Экземпляр клиента AmoClient.
+        pending_writes: Накопитель пакетных обновлений сделок, примечаний и задач.
         purchase_data: Объект DBStatePurchase с данными о закупке.
         pipeline_id: ID целевой воронки.
         target_status_id: ID целевого статуса в воронке.
-        exclude_user_ids_for_creation_filter: Список ID пользователей, закрепленные компании за которыми
+        exclude_user_ids_for_creation_filter: Множество ID пользователей, закрепленные компании за которыми
                                                  исключают создание новой сделки.
         id_user_anastasia_popova: ID пользователя "Анастасия Попова".
         id_user_unsorted: ID пользователя "Неразобранное".
+        resolution: Уже найденные для ИНН закупки компания и сделка (общие для закупок с одним ИНН).
     Returns:
         None.
     """
+    if resolution is None:
+        resolution = _InnResolution()
     current_lead_id: Optional[int] = None
     is_new_lead = False
     lead_current_responsible_id: Optional[int] = None
     lead_current_budget: Optional[float] = 0.0
     budget_changed_during_update = False
 
-    if purchase_data.contract_securing is None or purchase_data.contract_securing < settings.MIN_LEAD_BUDGET:
-        logger.debug(f"Пропуск (бюджет < {settings.MIN_LEAD_BUDGET}): '{purchase_data.winner_name}' ({purchase_data.purchase_number}), бюджет {purchase_data.contract_securing}")
-        return
-
     deal_name = purchase_data.winner_name
-    if not deal_name:
-        logger.warning(f"Пропуск (нет имени победителя): закупка '{purchase_data.purchase_number}'")
-        return
-
     logger.info(f"Обработка: '{deal_name}' (Закупка: {purchase_data.purchase_number}, ИНН: {purchase_data.inn})")
 
     company_id_to_link: Optional[int] = None
     company_responsible_user_id: Optional[int] = None
+    leads_search: Optional[asyncio.Task] = None
 
-    if purchase_data.inn:
-        found_companies = await amo_client.search_companies_by_inn(str(purchase_data.inn))
-        if found_companies:
-            company_info = found_companies[0]
-            company_id_to_link = company_info.get('id')
-            company_responsible_user_id = company_info.get('responsible_user_id')
-            logger.info(f"Компания с ИНН '{purchase_data.inn}' найдена: '{company_info.get('name')}' (ID: {company_id_to_link}).")
-            
-            if company_responsible_user_id in exclude_user_ids_for_creation_filter:
-                logger.info(f"Компания '{company_info.get('name')}' (ID: {company_id_to_link}) закреплена за исключенным менеджером ID {company_responsible_user_id}. Новая сделка не будет создаваться, обновление существующих также не будет.")
-                return
-        else:
-            logger.info(f"Компания с ИНН '{purchase_data.inn}' не найдена. Создаем новую.")
-            company_phones = [getattr(purchase_data, f'phone_{i}', None) for i in range(1, 4) if getattr(purchase_data, f'phone_{i}', None)]
-            company_emails = [getattr(purchase_data, f'email_{i}', None) for i in range(1, 4) if getattr(purchase_data, f'email_{i}', None)]
-
-            created_company = await amo_client.create_company(
-                name=purchase_data.winner_name,
-                inn=purchase_data.inn,
-                phone_numbers=company_phones,
-                emails=company_emails,
-                responsible_user_id=id_user_unsorted
+    if purchase_data.inn and resolution.company_resolved:
+        if resolution.company_excluded:
+            logger.info(f"Компания (ID: {resolution.company_id}) с ИНН '{purchase_data.inn}' закреплена за исключенным менеджером. Пропуск закупки '{purchase_data.purchase_number}'.")
+            return
+        company_id_to_link = resolution.company_id
+        company_responsible_user_id = resolution.company_responsible_user_id
+    elif purchase_data.inn:
+        if resolution.lead is None:
+            # Поиск сделки не зависит от компании, поэтому идет параллельно с ее поиском или созданием
+            leads_search = asyncio.create_task(
+                amo_client.search_leads_by_inn(pipeline_id, purchase_data.inn, first_only=True)
             )
-            if created_company:
-                company_id_to_link = created_company.get('id')
-                company_responsible_user_id = created_company.get('responsible_user_id')
-                logger.info(f"Новая компания '{purchase_data.winner_name}' (ID: {company_id_to_link}) создана с ответственным '{settings.USER_NAME_UNSORTED_LEADS}'.")
+        company_ready = False
+        try:
+            found_companies = await amo_client.search_companies_by_inn(str(purchase_data.inn))
+            if found_companies:
+                company_info = found_companies[0]
+                company_id_to_link = company_info.get('id')
+                company_responsible_user_id = company_info.get('responsible_user_id')
+                logger.info(f"Компания с ИНН '{purchase_data.inn}' найдена: '{company_info.get('name')}' (ID: {company_id_to_link}).")
+            
+                if company_responsible_user_id in exclude_user_ids_for_creation_filter:
+                    logger.info(f"Компания '{company_info.get('name')}' (ID: {company_id_to_link}) закреплена за исключенным менеджером ID {company_responsible_user_id}. Новая сделка не будет создаваться, обновление существующих также не будет.")
+                    resolution.company_resolved = resolution.company_excluded = True
+                    resolution.company_id = company_id_to_link
+                    return
             else:
-                logger.error(f"Не удалось создать компанию для '{purchase_data.winner_name}' (ИНН: {purchase_data.inn}).")
-                return
+                logger.info(f"Компания с ИНН '{purchase_data.inn}' не найдена. Создаем новую.")
+                created_company = await amo_client.create_company(
+                    name=purchase_data.winner_name,
+                    inn=purchase_data.inn,
+                    phone_numbers=list(purchase_data.phones),
+                    emails=list(purchase_data.emails),
+                    responsible_user_id=id_user_unsorted
+                )
+                if created_company:
+                    company_id_to_link = created_company.get('id')
+                    company_responsible_user_id = created_company.get('responsible_user_id')
+                    logger.info(f"Новая компания '{purchase_data.winner_name}' (ID: {company_id_to_link}) создана с ответственным '{settings.USER_NAME_UNSORTED_LEADS}'.")
+                else:
+                    logger.error(f"Не удалось создать компанию для '{purchase_data.winner_name}' (ИНН: {purchase_data.inn}).")
+                    return
+            resolution.company_resolved = True
+            resolution.company_id = company_id_to_link
+            resolution.company_responsible_user_id = company_responsible_user_id
+            company_ready = True
+        finally:
+            if leads_search is not None and not company_ready:
+                await _discard_task(leads_search)
 
     #found_leads = await amo_client.search_leads_by_name(pipeline_id, purchase_data.purchase_number)
-    found_leads = await amo_client.search_leads_by_inn(pipeline_id, purchase_data.inn)
+    if resolution.lead is not None:
+        found_leads = [resolution.lead]
+    elif leads_search is not None:
+        found_leads = await leads_search
+    else:
+        found_leads = await amo_client.search_leads_by_inn(pipeline_id, purchase_data.inn, first_only=True)
 
     lead_info_for_task: Dict[str, Any] = {"name": deal_name}
 
@@ -271,49 +504,54 @@ async def _handle_lead_processing(
         )
         if created_lead:
             current_lead_id = created_lead.get('id')
-            lead_info_for_task = created_lead
-            lead_current_responsible_id = created_lead.get('responsible_user_id')
+            # Ответ на создание сделки содержит только ID, ответственный и бюджет известны из запроса
+            lead_current_responsible_id = created_lead.get('responsible_user_id') or new_lead_responsible_id
+            lead_info_for_task = {
+                **created_lead,
+                'responsible_user_id': lead_current_responsible_id,
+                'price': purchase_data.contract_securing,
+            }
             logger.info(f"Новая сделка '{deal_name}' (ID: {current_lead_id}) успешно создана с ответственным ID {lead_current_responsible_id}.")
         else:
             logger.error(f"Не удалось создать новую сделку для '{deal_name}'.")
             return
 
+    resolution.lead = lead_info_for_task
     if current_lead_id and not is_new_lead and budget_changed_during_update:
         logger.info(f"Обновляем бюджет сделки ID {current_lead_id} на {purchase_data.contract_securing}.")
-        updated_lead = await amo_client.update_lead(
-            lead_id=current_lead_id,
-            price=purchase_data.contract_securing
-        )
-        if updated_lead:
-            logger.info(f"Бюджет сделки ID {current_lead_id} успешно обновлен.")
-        else:
-            logger.error(f"Не удалось обновить бюджет сделки ID {current_lead_id}.")
-
-    if current_lead_id and company_id_to_link:
-        linked_companies = await amo_client.get_linked_companies_to_lead(current_lead_id)
+        await pending_writes.add_lead_update(current_lead_id, price=purchase_data.contract_securing)
+        resolution.lead = {**lead_info_for_task, 'price': purchase_data.contract_securing}
+
+    if current_lead_id and company_id_to_link and (is_new_lead or resolution.company_linked):
+        # Новая сделка создается сразу с компанией, а привязка для этой же сделки уже проверена
+        resolution.company_linked = True
+    elif current_lead_id and company_id_to_link:
+        # Список сделок из поиска уже содержит привязанные компании в '_embedded',
+        # отдельный запрос нужен только если их там нет
+        linked_companies = lead_info_for_task.get('_embedded', {}).get('companies')
+        if linked_companies is None:
+            linked_companies = await amo_client.get_linked_companies_to_lead(current_lead_id)
         linked_company_ids = [comp.get('id') for comp in linked_companies]
 
         if company_id_to_link not in linked_company_ids:
             if await amo_client.link_company_to_lead(current_lead_id, company_id_to_link):
+                resolution.company_linked = True
                 logger.info(f"Компания ID {company_id_to_link} успешно привязана к сделке ID {current_lead_id}.")
             else:
                 logger.error(f"Не удалось привязать компанию ID {company_id_to_link} к сделке ID {current_lead_id}.")
         else:
+            resolution.company_linked = True
             logger.info(f"Компания ID {company_id_to_link} уже привязана к сделке ID {current_lead_id}. Пропуск привязки.")
     elif not company_id_to_link:
         logger.warning(f"Не удалось привязать компанию к сделке ID {current_lead_id}: company_id_to_link не определен.")
 
     if current_lead_id:
-        note_text = generate_note_text_for_win(purchase_data)
-        if await amo_client.add_note_to_lead(current_lead_id, note_text):
-            logger.info(f"Примечание успешно добавлено к сделке ID {current_lead_id}.")
-        else:
-            logger.error(f"Не удалось добавить примечание к сделке ID {current_lead_id}.")
+        await pending_writes.add_note(current_lead_id, generate_note_text_for_win(purchase_data))
 
         await _create_task(
-            amo_client,
+            pending_writes,
             current_lead_id,
-            lead_info_for_task,
+            lead_current_responsible_id,
             is_new_lead,
             purchase_data.purchase_number,
             id_user_anastasia_popova,
@@ -321,45 +559,93 @@ async def _handle_lead_processing(
         )
 
 
-async def process_parsed_data_for_amocrm(amo_client: AmoClient, parsed_purchases: List[DBStatePurchase]):
+async def process_parsed_data_for_amocrm(amo_client: AmoClient, parsed_purchases: Iterable[DBStatePurchase]):
     """
     Основная функция для обработки распарсенных данных о закупках и синхронизации с amoCRM.
 
     Args:
         amo_client: Экземпляр клиента AmoClient.
-        parsed_purchases: Список объектов DBStatePurchase с данными о закупках.
+        parsed_purchases: Объекты DBStatePurchase с данными о закупках (список или любой итерируемый источник).
     Returns:
         None.
     """
-    pipeline_id = await amo_client.get_pipeline_id(settings.PIPELINE_NAME_GOSZAKAZ)
+    context = amo_client.resolve_lead_context(
+        settings.PIPELINE_NAME_GOSZAKAZ,
+        settings.STATUS_NAME_POBEDITELI,
+        user_names=(
+            *settings.EXCLUDE_RESPONSIBLE_USERS,
+            settings.USER_NAME_DEFAULT_TASK_ASSIGN_POPOVA,
+            settings.USER_NAME_UNSORTED_LEADS,
+        ),
+    )
+    pipeline_id = context.pipeline_id
     if not pipeline_id: 
         logger.error(f"Воронка '{settings.PIPELINE_NAME_GOSZAKAZ}' не найдена."); return
 
-    target_status_id = await amo_client.get_status_id(pipeline_id, settings.STATUS_NAME_POBEDITELI)
+    target_status_id = context.status_id
     if not target_status_id: 
         logger.error(f"Этап '{settings.STATUS_NAME_POBEDITELI}' в воронке '{settings.PIPELINE_NAME_GOSZAKAZ}' не найден."); return
 
-    exclude_user_ids_for_filter: List[int] = []
+    exclude_user_ids: List[int] = []
     for user_name in settings.EXCLUDE_RESPONSIBLE_USERS:
-        user_id = await amo_client.get_user_id(user_name)
+        user_id = context.user_ids[user_name]
         if user_id:
-            exclude_user_ids_for_filter.append(user_id)
+            exclude_user_ids.append(user_id)
         else:
             logger.warning(f"Пользователь '{user_name}' из списка исключений не найден в amoCRM. Игнорируется.")
+    exclude_user_ids_for_filter = frozenset(exclude_user_ids)
 
-    id_anastasia_popova = await amo_client.get_user_id(settings.USER_NAME_DEFAULT_TASK_ASSIGN_POPOVA)
-    id_unsorted_leads = await amo_client.get_user_id(settings.USER_NAME_UNSORTED_LEADS)
+    id_anastasia_popova = context.user_ids[settings.USER_NAME_DEFAULT_TASK_ASSIGN_POPOVA]
+    id_unsorted_leads = context.user_ids[settings.USER_NAME_UNSORTED_LEADS]
 
     if not id_anastasia_popova:
         logger.warning(f"ID пользователя '{settings.USER_NAME_DEFAULT_TASK_ASSIGN_POPOVA}' (для задач) не найден. Логика задач может быть нарушена.")
     if not id_unsorted_leads:
         logger.warning(f"ID пользователя '{settings.USER_NAME_UNSORTED_LEADS}' не найден. Логика задач для неразобранных может быть нарушена.")
 
-    for purchase_data in parsed_purchases:
-        try:
-            await _handle_lead_processing(
-                amo_client, purchase_data, pipeline_id, target_status_id,
-                exclude_user_ids_for_filter, id_anastasia_popova, id_unsorted_leads
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при обработке закупки '{purchase_data.purchase_number}': {e}", exc_info=True)
\ No newline at end of file
+    pending_writes = _PendingWrites(amo_client)
+    concurrency = settings.amo_concurrency or 8
+    parsed_purchases = list(parsed_purchases)
+    eligible_purchases = list(filter(_is_eligible, parsed_purchases))
+    logger.info(f"К обработке в amoCRM: {len(eligible_purchases)} закупок, пропущено: {len(parsed_purchases) - len(eligible_purchases)}.")
+
+    # Закупки с одним ИНН обрабатываются одним обработчиком по очереди: компания и сделка
+    # ищутся один раз на группу, и параллельные обработчики не создадут их дважды
+    groups: Dict[str, List[DBStatePurchase]] = defaultdict(list)
+    for purchase_data in eligible_purchases:
+        groups[str(purchase_data.inn) if purchase_data.inn else f"#{purchase_data.purchase_number}"].append(purchase_data)
+
+    queue: asyncio.Queue[Optional[List[DBStatePurchase]]] = asyncio.Queue(maxsize=2 * concurrency)
+    processed_count = failed_count = 0
+
+    async def _worker():
+        nonlocal processed_count, failed_count
+        while (purchases := await queue.get()) is not None:
+            resolution = _InnResolution()
+            for purchase_data in purchases:
+                try:
+                    await _handle_lead_processing(
+                        amo_client, pending_writes, purchase_data, pipeline_id, target_status_id,
+                        exclude_user_ids_for_filter, id_anastasia_popova, id_unsorted_leads, resolution
+                    )
+                except Exception as e:
+                    failed_count += 1
+                    logger.error(f"Ошибка при обработке закупки '{purchase_data.purchase_number}': {e}", exc_info=True)
+                processed_count += 1
+                if processed_count % _PROGRESS_LOG_EVERY == 0:
+                    logger.info(f"Обработано закупок: {processed_count} из {len(eligible_purchases)} (с ошибкой: {failed_count}).")
+
+    workers = [asyncio.create_task(_worker()) for _ in range(min(concurrency, len(groups)))]
+    try:
+        for purchases in groups.values():
+            await queue.put(purchases)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        # Примечания, задачи и обновления уже созданных сделок отправляются и при прерывании обработки
+        await pending_writes.flush()
+
+    logger.info(f"Обработка закупок в amoCRM завершена: {processed_count} из {len(eligible_purchases)}, с ошибкой: {failed_count}.")
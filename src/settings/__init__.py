@@ -1,4 +1,6 @@
-from pydantic import Field
+import sys
+
+from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
 from typing import Optional, List
@@ -24,6 +26,8 @@ class Settings(BaseSettings):
     db_name: str
     db_host: str
     db_port: int
+    db_pool_min_size: int = Field(default=1)
+    db_pool_max_size: int = Field(default=4)
     mode: AppMode
 
     MIN_LEAD_BUDGET: int = 100_000
@@ -48,11 +52,37 @@ class Settings(BaseSettings):
     TASK_TYPE_NAME_DEFAULT: str = "Связаться с клиентом"
 
     CHECK_INTERVAL_SECONDS: int = 3600
+    IMAP_SEARCH_SINCE_DAYS: int = 7
+    IMAP_SEARCH_FROM: Optional[str] = None
+    # Каталог data/ монтируется в контейнер как том, чтобы состояние переживало пересоздание контейнера
+    IMAP_STATE_FILE: Path = BASE_DIR / 'data' / 'imap_state.json'
 
     test_amo_subdomain: Optional[str] = Field(default=None)
     test_amo_long_term_token: Optional[str] = Field(default=None)
 
-    request_delay: float = Field(default=0.5)
+    amo_rate_limit: float = Field(default=6.5)
+    amo_rate_burst: int = Field(default=7)
+    amo_inn_cache_ttl: float = Field(default=300)
+    # Воронки, пользователи и поля меняются редко. TTL в несколько интервалов проверки почты
+    # (CHECK_INTERVAL_SECONDS), чтобы следующий файл обрабатывался со справочниками из кэша,
+    # а изменения в amoCRM подхватывались в пределах нескольких часов
+    amo_ids_cache_ttl: float = Field(default=6 * 3600)
+    amo_concurrency: int = Field(default=8)
+
+    @field_validator(
+        'PIPELINE_NAME_GOSZAKAZ', 'STATUS_NAME_POBEDITELI', 'CUSTOM_FIELD_NAME_INN_LEAD',
+        'CUSTOM_FIELD_NAME_PURCHASE_LINK_LEAD', 'CUSTOM_FIELD_NAME_PURCHASE_NUMBER', 'CUSTOM_FIELD_NAME_INN_COMPANY',
+        'CUSTOM_FIELD_NAME_TIME_ZONE', 'USER_NAME_UNSORTED_LEADS', 'CUSTOM_FIELD_NAME_COMPANY_PHONE',
+        'CUSTOM_FIELD_NAME_COMPANY_EMAIL', 'USER_NAME_DEFAULT_TASK_ASSIGN_POPOVA', 'TASK_TYPE_NAME_DEFAULT'
+    )
+    @classmethod
+    def intern_lookup_names(cls, v: str) -> str:
+        return sys.intern(v)
+
+    @field_validator('EXCLUDE_RESPONSIBLE_USERS')
+    @classmethod
+    def intern_user_names(cls, v: List[str]) -> List[str]:
+        return [sys.intern(name) for name in v]
 
     @property
     def current_amo_subdomain(self) -> str:
@@ -0,0 +1,307 @@
+import asyncio
+import contextlib
+import gzip
+import json
+import unittest
+from collections import OrderedDict
+
+from aiohttp import ClientConnectionError, ClientResponseError
+
+from src.amo.client import AmoClient
+from src.amo.rate_limit import TokenBucket
+
+
+class FakeRequestClient(AmoClient):
+    """AmoClient без сети: ответы POST-запросов формируются из тела запроса"""
+    _BATCH_SIZE = 2
+
+    def __init__(self, entity: str, failing_batches: tuple[int, ...] = ()):
+        self.task_types_ids = {}
+        self.custom_fields_lead_ids = {}
+        self._entity = entity
+        self._failing_batches = failing_batches
+        self.requests = []
+
+    async def _request(self, method, url, json_data=None, **kwargs):
+        batch_number = len(self.requests)
+        self.requests.append(json_data)
+        if batch_number in self._failing_batches:
+            raise RuntimeError("batch failed")
+        # amoCRM не гарантирует порядок элементов в ответе, сопоставление идет по request_id
+        created = [
+            {"id": 1000 + int(item["request_id"]), "request_id": item["request_id"]}
+            for item in reversed(json_data)
+        ]
+        return {"_embedded": {self._entity: created}}
+
+
+class BulkRequestIdMappingTest(unittest.IsolatedAsyncioTestCase):
+    async def test_create_leads_bulk(self):
+        client = FakeRequestClient('leads', failing_batches=(1,))
+        leads = [{"name": f"Сделка {i}", "price": 1, "pipeline_id": 1, "status_id": 1} for i in range(5)]
+        with self.assertLogs('src.amo.client', level='ERROR'):
+            created = await client.create_leads_bulk(leads)
+        self.assertEqual([lead and lead["id"] for lead in created], [1000, 1001, None, None, 1004])
+        self.assertEqual([item["request_id"] for item in client.requests[2]], ["4"])
+
+    async def test_add_notes_to_leads_bulk(self):
+        client = FakeRequestClient('notes')
+        notes = [{"lead_id": 10 + i, "text": "note"} for i in range(3)]
+        created = await client.add_notes_to_leads_bulk(notes)
+        self.assertEqual([note["id"] for note in created], [1000, 1001, 1002])
+        self.assertEqual([item["entity_id"] for item in client.requests[0]], [10, 11])
+
+    async def test_create_tasks_bulk_skips_invalid_tasks(self):
+        client = FakeRequestClient('tasks')
+        tasks = [
+            {"entity_id": 1, "responsible_user_id": 5, "text": "t", "complete_till_timestamp": 100},
+            {"entity_id": 2, "responsible_user_id": None, "text": "t", "complete_till_timestamp": 100},
+            {"entity_id": 3, "responsible_user_id": 5, "text": "t", "complete_till_timestamp": 100},
+            {"entity_id": 4, "responsible_user_id": 5, "text": "t", "complete_till_timestamp": 100},
+        ]
+        with self.assertLogs('src.amo.client', level='ERROR'):
+            created = await client.create_tasks_bulk(tasks)
+        self.assertEqual([task and task["id"] for task in created], [1000, None, 1002, 1003])
+        self.assertEqual(
+            [[item["entity_id"] for item in batch] for batch in client.requests],
+            [[1, 3], [4]]
+        )
+
+
+class FlakyClient(AmoClient):
+    """AmoClient, у которого каждая попытка запроса берет следующий результат из списка"""
+    _RETRY_BASE_DELAY = 0
+
+    def __init__(self, outcomes: list):
+        self._outcomes = list(outcomes)
+        self.attempts = 0
+
+    async def _send_request(self, method, url, json_data=None, params=None):
+        self.attempts += 1
+        outcome = self._outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def response_error(status: int) -> ClientResponseError:
+    return ClientResponseError(request_info=None, history=(), status=status)
+
+
+class RetryPolicyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_429_on_post_is_retried(self):
+        client = FlakyClient([response_error(429), {"ok": True}])
+        self.assertEqual(await client._request('POST', '/leads', json_data=[{}]), {"ok": True})
+        self.assertEqual(client.attempts, 2)
+
+    async def test_5xx_is_retried_for_idempotent_methods(self):
+        for method in ('GET', 'PATCH'):
+            with self.subTest(method=method):
+                client = FlakyClient([response_error(503), ClientConnectionError(), {"ok": True}])
+                self.assertEqual(await client._request(method, '/leads'), {"ok": True})
+                self.assertEqual(client.attempts, 3)
+
+    async def test_5xx_and_connection_errors_on_post_are_not_retried(self):
+        for error in (response_error(500), ClientConnectionError()):
+            with self.subTest(error=error):
+                client = FlakyClient([error, {"ok": True}])
+                with self.assertRaises(type(error)):
+                    await client._request('POST', '/leads', json_data=[{}])
+                self.assertEqual(client.attempts, 1)
+
+    async def test_client_errors_are_not_retried(self):
+        client = FlakyClient([response_error(400), {"ok": True}])
+        with self.assertRaises(ClientResponseError):
+            await client._request('GET', '/leads')
+        self.assertEqual(client.attempts, 1)
+
+    async def test_gives_up_after_attempt_cap(self):
+        client = FlakyClient([response_error(429)] * (AmoClient._MAX_RETRIES + 2))
+        with self.assertRaises(ClientResponseError):
+            await client._request('POST', '/leads', json_data=[{}])
+        self.assertEqual(client.attempts, AmoClient._MAX_RETRIES + 1)
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    def test_numeric_value(self):
+        self.assertEqual(AmoClient._parse_retry_after('3'), 3.0)
+        self.assertEqual(AmoClient._parse_retry_after('1.5'), 1.5)
+
+    def test_negative_value_is_clamped(self):
+        self.assertEqual(AmoClient._parse_retry_after('-5'), 0.0)
+
+    def test_missing_or_invalid_value_uses_default(self):
+        for value in (None, '', 'Wed, 21 Oct 2015 07:28:00 GMT'):
+            with self.subTest(value=value):
+                self.assertEqual(AmoClient._parse_retry_after(value, default=2.0), 2.0)
+
+class FakeResponse:
+    def __init__(self, status: int, body: bytes = b''):
+        self.status = status
+        self.headers = {}
+        self._body = body
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self) -> str:
+        return self._body.decode()
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise response_error(self.status)
+
+
+class FakeSession:
+    """Сессия aiohttp, отдающая заранее заданные ответы и запоминающая запросы"""
+
+    def __init__(self, responses: list[FakeResponse]):
+        self._responses = list(responses)
+        self.requests: list[dict] = []
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, **kwargs):
+        self.requests.append(kwargs)
+        yield self._responses.pop(0)
+
+
+def make_sending_client(session: FakeSession) -> AmoClient:
+    client = AmoClient.__new__(AmoClient)
+    client._base_url = 'https://test.amocrm.ru/api/v4'
+    client._urls = {}
+    client._inflight = asyncio.Semaphore(1)
+    client._rate_limit = TokenBucket(rate=1000, capacity=1000)
+    client._gzip_requests = True
+    client._session = session
+    return client
+
+
+class GzipFallbackTest(unittest.IsolatedAsyncioTestCase):
+    async def test_415_resends_uncompressed_body_once(self):
+        session = FakeSession([FakeResponse(415), FakeResponse(200, b'{"ok": true}')])
+        client = make_sending_client(session)
+        payload = [{"name": f"Сделка {i}"} for i in range(AmoClient._GZIP_MIN_ITEMS + 1)]
+
+        with self.assertLogs('src.amo.client', level='WARNING'):
+            self.assertEqual(await client._send_request('POST', '/leads', json_data=payload), {"ok": True})
+
+        self.assertEqual(len(session.requests), 2)
+        compressed, plain = session.requests
+        self.assertEqual(compressed['headers'].get('Content-Encoding'), 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(compressed['data'])), payload)
+        self.assertNotIn('Content-Encoding', plain['headers'])
+        self.assertEqual(json.loads(plain['data']), payload)
+        self.assertFalse(client._gzip_requests)
+
+    async def test_415_for_uncompressed_body_is_an_error(self):
+        session = FakeSession([FakeResponse(415), FakeResponse(200, b'{}')])
+        client = make_sending_client(session)
+
+        with self.assertLogs('src.amo.client', level='ERROR'), self.assertRaises(ClientResponseError):
+            await client._send_request('POST', '/leads', json_data=[{"name": "Сделка"}])
+        self.assertEqual(len(session.requests), 1)
+
+class CompanySearchClient(AmoClient):
+    """AmoClient с поддельным поиском компаний: каждый поиск ждет release и возвращает текущий список компаний"""
+
+    def __init__(self):
+        self._inn_cache = OrderedDict()
+        self._inn_inflight = {}
+        self._inn_generations = {}
+        self.custom_fields_company_ids = {}
+        self.companies: list[dict] = []
+        self.fetches = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def _fetch_companies_by_inn(self, inn):
+        self.fetches += 1
+        snapshot = [dict(company) for company in self.companies]
+        await self.release.wait()
+        return snapshot
+
+    async def _request(self, method, url, json_data=None, **kwargs):
+        created = [{"id": 500 + i, "request_id": item["request_id"]} for i, item in enumerate(json_data)]
+        self.companies.extend({"id": company["id"]} for company in created)
+        return {"_embedded": {"companies": created}}
+
+
+class CompanySearchCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_searches_share_one_request(self):
+        client = CompanySearchClient()
+        client.companies = [{"id": 1}]
+        client.release.clear()
+        searches = [asyncio.create_task(client.search_companies_by_inn('7701234567')) for _ in range(3)]
+        await asyncio.sleep(0)
+        client.release.set()
+        self.assertEqual(await asyncio.gather(*searches), [[{"id": 1}]] * 3)
+        self.assertEqual(client.fetches, 1)
+
+    async def test_results_are_independent_copies(self):
+        client = CompanySearchClient()
+        client.companies = [{"id": 1, "name": "ООО Победитель"}]
+        first = await client.search_companies_by_inn('7701234567')
+        first[0]["name"] = "изменено"
+        first.append({"id": 2})
+        self.assertEqual(await client.search_companies_by_inn('7701234567'), [{"id": 1, "name": "ООО Победитель"}])
+        self.assertEqual(client.fetches, 1)
+
+    async def test_search_started_before_company_creation_is_not_cached(self):
+        client = CompanySearchClient()
+        client.release.clear()
+        stale_search = asyncio.create_task(client.search_companies_by_inn('7701234567'))
+        await asyncio.sleep(0)
+
+        await client.create_companies_bulk([{"name": "ООО Победитель", "inn": '7701234567'}])
+        client.release.set()
+        self.assertEqual(await stale_search, [])
+
+        self.assertEqual(await client.search_companies_by_inn('7701234567'), [{"id": 500}])
+        self.assertEqual(client.fetches, 2)
+
+    async def test_cached_result_is_dropped_after_company_creation(self):
+        client = CompanySearchClient()
+        self.assertEqual(await client.search_companies_by_inn('7701234567'), [])
+        await client.create_companies_bulk([{"name": "ООО Победитель", "inn": '7701234567'}])
+        self.assertEqual(await client.search_companies_by_inn('7701234567'), [{"id": 500}])
+
+class CountingPagesClient(AmoClient):
+    """AmoClient, у которого справочники загружаются из заранее заданных страниц"""
+    pages = {
+        '/leads/pipelines': [{'id': 1, 'name': 'Воронка', '_embedded': {'statuses': [{'id': 2, 'name': 'Этап'}]}}],
+        '/users': [{'id': 3, 'name': 'Менеджер'}],
+        '/leads/custom_fields': [{'id': 4, 'name': 'ИНН клиента'}],
+        '/companies/custom_fields': [{'id': 5, 'name': 'ИНН'}],
+    }
+    loads = 0
+
+    async def _get_all_pages(self, endpoint, entity_key_in_embedded, params=None):
+        type(self).loads += 1
+        return self.pages[endpoint]
+
+
+class IdsCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        cache = dict(AmoClient._ids_cache)
+        AmoClient._ids_cache.clear()
+        self.addCleanup(lambda: (AmoClient._ids_cache.clear(), AmoClient._ids_cache.update(cache)))
+        CountingPagesClient.loads = 0
+
+    async def test_second_client_uses_cache_with_own_copies(self):
+        first = CountingPagesClient()
+        await first._ensure_ids_initialized()
+        first.users_ids['Новый'] = 99
+        first.statuses_ids[1]['Новый этап'] = 98
+
+        second = CountingPagesClient()
+        with self.assertLogs('src.amo.client', level='INFO'):
+            await second._ensure_ids_initialized()
+
+        self.assertEqual(CountingPagesClient.loads, 4)
+        self.assertEqual(second.users_ids, {'Менеджер': 3})
+        self.assertEqual(second.statuses_ids, {1: {'Этап': 2}})
+        self.assertEqual(second._status_by_names, {('Воронка', 'Этап'): (1, 2)})
+        self.assertIsNot(second.users_ids, first.users_ids)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,286 @@
+import asyncio
+import gc
+import unittest
+from datetime import datetime
+
+from src.amo.client import LeadContext
+from src.amo.schemas import DBStatePurchase
+from src.processing import amocrm_processor
+from src.processing.amocrm_processor import _InnResolution, _PendingWrites, _handle_lead_processing, _is_eligible
+from src.settings import settings
+
+PIPELINE_ID = 1
+STATUS_ID = 2
+EXCLUDED_USER_ID = 100
+POPOVA_USER_ID = 200
+UNSORTED_USER_ID = 300
+MANAGER_USER_ID = 400
+
+
+def make_purchase(purchase_number: str, inn: str | None = '7701234567', budget: float = 500_000) -> DBStatePurchase:
+    return DBStatePurchase(
+        extraction_dt=datetime(2024, 3, 5),
+        purchase_number=purchase_number,
+        winner_name='ООО Победитель',
+        inn=inn,
+        contract_securing=budget,
+    )
+
+
+class FakeAmoClient:
+    """AmoClient без сети: записывает вызовы и отвечает заранее заданными данными"""
+
+    def __init__(self, companies: list | None = None, leads: list | None = None):
+        self.companies = companies or []
+        self.leads = leads or []
+        self.calls: list[tuple[str, tuple, dict]] = []
+
+    def _record(self, method: str, *args, **kwargs) -> None:
+        self.calls.append((method, args, kwargs))
+
+    def calls_to(self, name: str) -> list[tuple[tuple, dict]]:
+        return [(args, kwargs) for call_name, args, kwargs in self.calls if call_name == name]
+
+    def resolve_lead_context(self, pipeline_name, status_name, user_names=()):
+        user_ids = {name: None for name in user_names}
+        user_ids.update({name: EXCLUDED_USER_ID for name in settings.EXCLUDE_RESPONSIBLE_USERS})
+        user_ids[settings.USER_NAME_DEFAULT_TASK_ASSIGN_POPOVA] = POPOVA_USER_ID
+        user_ids[settings.USER_NAME_UNSORTED_LEADS] = UNSORTED_USER_ID
+        return LeadContext(PIPELINE_ID, STATUS_ID, user_ids, {})
+
+    async def search_companies_by_inn(self, inn):
+        self._record('search_companies_by_inn', inn)
+        return list(self.companies)
+
+    async def create_company(self, **kwargs):
+        self._record('create_company', **kwargs)
+        return {'id': 10, 'responsible_user_id': kwargs.get('responsible_user_id')}
+
+    async def search_leads_by_inn(self, pipeline_id, inn, first_only=False):
+        self._record('search_leads_by_inn', pipeline_id, inn, first_only=first_only)
+        return list(self.leads)
+
+    async def create_lead(self, **kwargs):
+        self._record('create_lead', **kwargs)
+        return {'id': 20}
+
+    async def get_linked_companies_to_lead(self, lead_id):
+        self._record('get_linked_companies_to_lead', lead_id)
+        return []
+
+    async def link_company_to_lead(self, lead_id, company_id):
+        self._record('link_company_to_lead', lead_id, company_id)
+        return True
+
+    async def update_leads_bulk(self, updates):
+        self._record('update_leads_bulk', updates)
+        return [{'id': update['lead_id']} for update in updates]
+
+    async def add_notes_to_leads_bulk(self, notes):
+        self._record('add_notes_to_leads_bulk', notes)
+        return [{'id': i} for i, _ in enumerate(notes)]
+
+    async def create_tasks_bulk(self, tasks):
+        self._record('create_tasks_bulk', tasks)
+        return [{'id': i} for i, _ in enumerate(tasks)]
+
+
+class HandleLeadProcessingTest(unittest.IsolatedAsyncioTestCase):
+    async def process_group(self, client: FakeAmoClient, purchases: list[DBStatePurchase]) -> _InnResolution:
+        pending_writes = _PendingWrites(client)
+        resolution = _InnResolution()
+        for purchase in purchases:
+            await _handle_lead_processing(
+                client, pending_writes, purchase, PIPELINE_ID, STATUS_ID,
+                frozenset({EXCLUDED_USER_ID}), POPOVA_USER_ID, UNSORTED_USER_ID, resolution
+            )
+        await pending_writes.flush()
+        return resolution
+
+    async def test_second_purchase_reuses_created_company_and_lead(self):
+        client = FakeAmoClient()
+        resolution = await self.process_group(client, [make_purchase('1'), make_purchase('2')])
+
+        self.assertEqual(len(client.calls_to('search_companies_by_inn')), 1)
+        self.assertEqual(len(client.calls_to('create_company')), 1)
+        self.assertEqual(len(client.calls_to('search_leads_by_inn')), 1)
+        self.assertEqual(len(client.calls_to('create_lead')), 1)
+        self.assertEqual(client.calls_to('create_lead')[0][1]['company_id'], 10)
+        self.assertEqual(resolution.company_id, 10)
+        self.assertEqual(resolution.lead['id'], 20)
+        # Бюджет созданной сделки запомнен, второй закупке с тем же бюджетом обновление не нужно
+        self.assertEqual(client.calls_to('update_leads_bulk'), [])
+        self.assertFalse(client.calls_to('get_linked_companies_to_lead'))
+        (notes,), _ = client.calls_to('add_notes_to_leads_bulk')[0]
+        self.assertEqual([note['lead_id'] for note in notes], [20, 20])
+
+    async def test_second_purchase_reuses_found_company_and_lead(self):
+        client = FakeAmoClient(
+            companies=[{'id': 11, 'name': 'ООО Победитель', 'responsible_user_id': MANAGER_USER_ID}],
+            leads=[{'id': 21, 'price': 500_000, 'responsible_user_id': MANAGER_USER_ID,
+                    '_embedded': {'companies': [{'id': 11}]}}],
+        )
+        await self.process_group(client, [make_purchase('1'), make_purchase('2', budget=700_000)])
+
+        self.assertEqual(len(client.calls_to('search_companies_by_inn')), 1)
+        self.assertEqual(len(client.calls_to('search_leads_by_inn')), 1)
+        self.assertFalse(client.calls_to('create_company'))
+        self.assertFalse(client.calls_to('create_lead'))
+        self.assertFalse(client.calls_to('link_company_to_lead'))
+        (updates,), _ = client.calls_to('update_leads_bulk')[0]
+        self.assertEqual(updates, [{'lead_id': 21, 'price': 700_000}])
+        (tasks,), _ = client.calls_to('create_tasks_bulk')[0]
+        self.assertEqual([task['responsible_user_id'] for task in tasks], [MANAGER_USER_ID, MANAGER_USER_ID])
+
+    async def test_excluded_manager_short_circuits_group(self):
+        client = FakeAmoClient(companies=[{'id': 12, 'name': 'ООО Победитель', 'responsible_user_id': EXCLUDED_USER_ID}])
+        resolution = await self.process_group(client, [make_purchase('1'), make_purchase('2'), make_purchase('3')])
+
+        self.assertTrue(resolution.company_excluded)
+        self.assertEqual(len(client.calls_to('search_companies_by_inn')), 1)
+        for name in ('create_company', 'create_lead', 'update_leads_bulk', 'add_notes_to_leads_bulk', 'create_tasks_bulk'):
+            self.assertFalse(client.calls_to(name), name)
+
+
+class PendingWritesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_lead_updates_are_coalesced_by_lead_id(self):
+        client = FakeAmoClient()
+        pending_writes = _PendingWrites(client)
+        await pending_writes.add_lead_update(21, price=100)
+        await pending_writes.add_lead_update(22, price=200)
+        await pending_writes.add_lead_update(21, price=300)
+        await pending_writes.add_lead_update(21, name='Новое имя')
+        await pending_writes.flush()
+
+        (updates,), _ = client.calls_to('update_leads_bulk')[0]
+        self.assertEqual(updates, [
+            {'lead_id': 21, 'price': 300, 'name': 'Новое имя'},
+            {'lead_id': 22, 'price': 200},
+        ])
+
+    async def test_full_batch_is_sent_without_flush(self):
+        client = FakeAmoClient()
+        pending_writes = _PendingWrites(client)
+        pending_writes.FLUSH_SIZE = 2
+        for lead_id in (1, 1, 2, 3):
+            await pending_writes.add_lead_update(lead_id, price=lead_id)
+
+        self.assertEqual([len(args[0]) for args, _ in client.calls_to('update_leads_bulk')], [2])
+        await pending_writes.flush()
+        self.assertEqual(client.calls_to('update_leads_bulk')[-1][0][0], [{'lead_id': 3, 'price': 3}])
+
+    async def test_group_budget_updates_are_coalesced(self):
+        client = FakeAmoClient(leads=[{'id': 21, 'price': 500_000, 'responsible_user_id': MANAGER_USER_ID,
+                                       '_embedded': {'companies': []}}])
+        await amocrm_processor.process_parsed_data_for_amocrm(client, [
+            make_purchase('1', budget=600_000),
+            make_purchase('2', budget=700_000),
+            make_purchase('3', budget=800_000),
+        ])
+
+        self.assertEqual(len(client.calls_to('update_leads_bulk')), 1)
+        (updates,), _ = client.calls_to('update_leads_bulk')[0]
+        self.assertEqual(updates, [{'lead_id': 21, 'price': 800_000}])
+
+
+class ParallelLeadSearchTest(unittest.IsolatedAsyncioTestCase):
+    async def process_with_failed_company(self, search_leads_by_inn) -> list[dict]:
+        client = FakeAmoClient()
+
+        async def create_company(**kwargs):
+            for _ in range(3):
+                await asyncio.sleep(0)
+            return None
+
+        client.create_company = create_company
+        client.search_leads_by_inn = search_leads_by_inn
+        unhandled = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        with self.assertLogs(amocrm_processor.logger, level='ERROR'):
+            await _handle_lead_processing(
+                client, _PendingWrites(client), make_purchase('1'), PIPELINE_ID, STATUS_ID,
+                frozenset(), POPOVA_USER_ID, UNSORTED_USER_ID
+            )
+        gc.collect()
+        return unhandled
+
+    async def test_failed_search_exception_is_retrieved(self):
+        async def failing_search(*args, **kwargs):
+            raise RuntimeError("search failed")
+
+        self.assertEqual(await self.process_with_failed_company(failing_search), [])
+
+    async def test_pending_search_is_cancelled(self):
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def hanging_search(*args, **kwargs):
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        self.assertEqual(await self.process_with_failed_company(hanging_search), [])
+        self.assertTrue(started.is_set())
+        self.assertTrue(cancelled.is_set())
+
+
+class IsEligibleTest(unittest.TestCase):
+    def test_budget_threshold(self):
+        self.assertTrue(_is_eligible(make_purchase('1', budget=settings.MIN_LEAD_BUDGET)))
+        self.assertFalse(_is_eligible(make_purchase('2', budget=settings.MIN_LEAD_BUDGET - 1)))
+        self.assertFalse(_is_eligible(make_purchase('3', budget=None)))
+
+    def test_winner_name_required(self):
+        self.assertFalse(_is_eligible(make_purchase('1').model_copy(update={'winner_name': None})))
+
+
+class ProcessParsedDataTest(unittest.IsolatedAsyncioTestCase):
+    async def test_purchases_are_grouped_by_inn(self):
+        client = FakeAmoClient()
+        await amocrm_processor.process_parsed_data_for_amocrm(client, iter([
+            make_purchase('1', inn='1111111111'),
+            make_purchase('2', inn='2222222222'),
+            make_purchase('3', inn='1111111111'),
+            make_purchase('4', inn='3333333333', budget=1),
+        ]))
+
+        self.assertEqual(
+            sorted(args[0] for args, _ in client.calls_to('search_companies_by_inn')),
+            ['1111111111', '2222222222']
+        )
+        (notes,), _ = client.calls_to('add_notes_to_leads_bulk')[0]
+        self.assertEqual(len(notes), 3)
+
+
+    async def test_pending_writes_are_flushed_when_processing_is_cancelled(self):
+        client = FakeAmoClient()
+        stalled = asyncio.Event()
+        search_companies_by_inn = client.search_companies_by_inn
+
+        async def stall_second_group(inn):
+            if inn == '2222222222':
+                stalled.set()
+                await asyncio.Event().wait()
+            return await search_companies_by_inn(inn)
+
+        client.search_companies_by_inn = stall_second_group
+        processing = asyncio.create_task(amocrm_processor.process_parsed_data_for_amocrm(client, [
+            make_purchase('1', inn='1111111111'),
+            make_purchase('2', inn='2222222222'),
+        ]))
+        await stalled.wait()
+        while not client.calls_to('create_lead'):
+            await asyncio.sleep(0)
+        processing.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await processing
+
+        (notes,), _ = client.calls_to('add_notes_to_leads_bulk')[0]
+        self.assertEqual([note['lead_id'] for note in notes], [20])
+        (tasks,), _ = client.calls_to('create_tasks_bulk')[0]
+        self.assertEqual([task['entity_id'] for task in tasks], [20])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import contextlib
+import re
+import unittest
+from datetime import date, datetime
+from pathlib import Path
+
+from src.amo.schemas import DBStatePurchase
+from src.db.abc import BatchInsertMixin
+from src.db.postgres import db as postgres_db
+
+INIT_SQL = Path(__file__).resolve().parent / 'src' / 'db' / 'init_scripts' / 'init.sql'
+
+
+def make_purchase(purchase_number: str, winner_name: str = 'ООО Победитель') -> DBStatePurchase:
+    return DBStatePurchase(extraction_dt=datetime(2024, 3, 5), purchase_number=purchase_number, winner_name=winner_name)
+
+
+class RecordingWriter(BatchInsertMixin):
+    batch_size = 2
+
+    def __init__(self, failing_batch: int | None = None):
+        self.batches: list[list[tuple[str, str]]] = []
+        self.cancelled = 0
+        self._failing_batch = failing_batch
+
+    async def _write_batch(self, batch):
+        number = len(self.batches)
+        self.batches.append([(purchase.purchase_number, purchase.winner_name) for purchase in batch])
+        if number == self._failing_batch:
+            raise RuntimeError("batch failed")
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+class BatchInsertMixinTest(unittest.IsolatedAsyncioTestCase):
+    def test_write_batch_is_abstract(self):
+        class Incomplete(BatchInsertMixin):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    async def test_duplicates_keep_last_record_and_are_split_into_batches(self):
+        writer = RecordingWriter()
+        await writer.write_purchases([
+            make_purchase('1', 'первый'),
+            make_purchase('2'),
+            make_purchase('1', 'последний'),
+            make_purchase('3'),
+            make_purchase('4'),
+        ])
+        self.assertEqual(writer.batches, [
+            [('1', 'последний'), ('2', 'ООО Победитель')],
+            [('3', 'ООО Победитель'), ('4', 'ООО Победитель')],
+        ])
+
+    async def test_failed_batch_cancels_the_others(self):
+        writer = RecordingWriter(failing_batch=1)
+        with self.assertRaises(RuntimeError):
+            await writer.write_purchases([make_purchase(str(i)) for i in range(6)])
+        self.assertEqual(len(writer.batches), 3)
+        self.assertEqual(writer.cancelled, 2)
+
+
+class FakeCursor:
+    def __init__(self, executed: list):
+        self._executed = executed
+
+    async def execute(self, stmt, params=None):
+        self._executed.append((stmt, params))
+
+
+class FakePool:
+    """Пул aiopg без сервера: запоминает выполненные запросы"""
+
+    def __init__(self):
+        self.executed: list[tuple[str, list]] = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @contextlib.asynccontextmanager
+    async def cursor(self):
+        yield FakeCursor(self.executed)
+
+
+class PostgresUpsertTest(unittest.IsolatedAsyncioTestCase):
+    def test_columns_match_table_definition(self):
+        sql_types = {'text': 'TEXT', 'numeric': 'NUMERIC', 'date': 'DATE', 'timestamptz': 'TIMESTAMP WITH TIME ZONE'}
+        table = dict(re.findall(r'^\s+(\w+) ([A-Z][A-Z ]*[A-Z])', INIT_SQL.read_text(encoding='utf-8'), re.MULTILINE))
+        for name, sql_type in postgres_db._COLUMNS:
+            with self.subTest(column=name):
+                self.assertTrue(table[name].startswith(sql_types[sql_type]), table[name])
+        self.assertLessEqual(set(postgres_db._COLUMN_NAMES), set(DBStatePurchase.model_fields))
+
+    def test_statements_follow_column_order(self):
+        names = ', '.join(postgres_db._COLUMN_NAMES)
+        self.assertIn(f"INSERT INTO state_purchases ({names}) ", postgres_db._PREPARE_STMT)
+        self.assertIn(
+            "unnest(" + ', '.join(f'${i}' for i in range(1, len(postgres_db._COLUMNS) + 1)) + ")",
+            postgres_db._PREPARE_STMT
+        )
+        self.assertIn("ON CONFLICT (purchase_number) DO UPDATE SET eis_url = EXCLUDED.eis_url,", postgres_db._PREPARE_STMT)
+        self.assertNotIn("purchase_number = EXCLUDED", postgres_db._PREPARE_STMT)
+        self.assertEqual(
+            re.findall(r'%s::(\w+)\[\]', postgres_db._EXECUTE_STMT),
+            [sql_type for _, sql_type in postgres_db._COLUMNS]
+        )
+
+    async def test_batch_is_sent_as_column_arrays(self):
+        pool = FakePool()
+        database = postgres_db.PostgresDB()
+        database._conn = pool
+        extraction_dt = datetime(2024, 3, 5, 10, 0)
+        await database._write_batch((
+            DBStatePurchase(extraction_dt=extraction_dt, purchase_number='1', inn='7701234567',
+                            nmck=1000.5, result_date=date(2024, 3, 1)),
+            DBStatePurchase(extraction_dt=extraction_dt, purchase_number='2', winner_name='ООО Победитель'),
+        ))
+
+        (stmt, params), = pool.executed
+        self.assertEqual(stmt, postgres_db._EXECUTE_STMT)
+        self.assertEqual(len(params), len(postgres_db._COLUMNS))
+        columns = dict(zip(postgres_db._COLUMN_NAMES, params))
+        self.assertEqual(columns['purchase_number'], ['1', '2'])
+        self.assertEqual(columns['inn'], ['7701234567', None])
+        self.assertEqual(columns['winner_name'], [None, 'ООО Победитель'])
+        self.assertEqual(columns['nmck'], [1000.5, None])
+        self.assertEqual(columns['result_date'], [date(2024, 3, 1), None])
+        self.assertEqual(columns['extraction_dt'], [extraction_dt, extraction_dt])
+        self.assertEqual(columns['phone_3'], [None, None])
+
+if __name__ == '__main__':
+    unittest.main()
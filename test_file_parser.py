@@ -0,0 +1,47 @@
+import unittest
+from datetime import date
+
+from src.mail.file_parser import ExcelParser
+
+
+class MakeUniqueColumnsTest(unittest.TestCase):
+    def test_duplicates_get_numeric_suffixes(self):
+        self.assertEqual(
+            ExcelParser._make_unique_columns(['ФИО 1', 'ФИО 1', 'ИНН', 'ФИО 1']),
+            ['ФИО 1', 'ФИО 1.1', 'ИНН', 'ФИО 1.2']
+        )
+
+    def test_empty_headers_are_unnamed_by_position(self):
+        self.assertEqual(
+            ExcelParser._make_unique_columns(['ИНН', None, 'Телефон', None]),
+            ['ИНН', 'Unnamed: 1', 'Телефон', 'Unnamed: 3']
+        )
+
+    def test_suffix_does_not_collide_with_existing_column(self):
+        self.assertEqual(
+            ExcelParser._make_unique_columns(['A', 'A.1', 'A', 'A']),
+            ['A', 'A.1', 'A.2', 'A.3']
+        )
+
+    def test_non_string_headers(self):
+        self.assertEqual(ExcelParser._make_unique_columns([1, 1.5, 1]), ['1', '1.5', '1.1'])
+
+
+class ParseDateStringTest(unittest.TestCase):
+    def test_fixed_width_date(self):
+        self.assertEqual(ExcelParser._parse_date_string('05.03.2024'), date(2024, 3, 5))
+
+    def test_surrounding_whitespace(self):
+        self.assertEqual(ExcelParser._parse_date_string(' 31.12.2023 '), date(2023, 12, 31))
+
+    def test_without_leading_zeros_falls_back_to_strptime(self):
+        self.assertEqual(ExcelParser._parse_date_string('5.3.2024'), date(2024, 3, 5))
+
+    def test_invalid_dates(self):
+        for value in ('31.02.2024', '2024-03-05', '', 'не дата', '١٢.٠٣.٢٠٢٤', '12.03.20245'):
+            with self.subTest(value=value):
+                self.assertIsNone(ExcelParser._parse_date_string(value))
+
+
+if __name__ == '__main__':
+    unittest.main()
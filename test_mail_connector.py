@@ -0,0 +1,152 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from src.mail.mail_connector import Gmail
+from src.settings import settings
+
+
+MULTIPART_FETCH = [
+    b'1 (UID 42 BODYSTRUCTURE (('
+    b'"text" "plain" ("charset" "utf-8") NIL NIL "7bit" 12 1 NIL NIL NIL NIL)('
+    b'"application" "vnd.openxmlformats-officedocument.spreadsheetml.sheet" ("name" "winners.xlsx") '
+    b'NIL NIL "base64" 2048 NIL ("attachment" ("filename" "winners.xlsx")) NIL NIL) '
+    b'"mixed" ("boundary" "xyz") NIL NIL NIL))'
+]
+
+
+class ParseBodystructureTest(unittest.TestCase):
+    def test_nested_lists_strings_and_nil(self):
+        body = Gmail._parse_bodystructure(MULTIPART_FETCH)
+        text_part, excel_part = body[0], body[1]
+        self.assertEqual(text_part[:3], ['text', 'plain', ['charset', 'utf-8']])
+        self.assertIsNone(text_part[3])
+        self.assertEqual(excel_part[5], 'base64')
+        self.assertEqual(excel_part[8], ['attachment', ['filename', 'winners.xlsx']])
+        self.assertEqual(body[2], 'mixed')
+
+    def test_escaped_quotes_in_string(self):
+        body = Gmail._parse_bodystructure([b'1 (BODYSTRUCTURE ("text" "plain" ("name" "a \\"b\\".txt") NIL NIL "7bit" 1 1))'])
+        self.assertEqual(body[2], ['name', 'a "b".txt'])
+
+    def test_literal_is_substituted_as_string(self):
+        fetch_data = [
+            (b'1 (UID 7 BODYSTRUCTURE ("application" "octet-stream" ("name" {9}', b'r "1".xls'),
+            b') NIL NIL "base64" 10 NIL ("attachment" NIL) NIL NIL))',
+        ]
+        body = Gmail._parse_bodystructure(fetch_data)
+        self.assertEqual(body[2], ['name', 'r "1".xls'])
+
+    def test_missing_bodystructure_raises(self):
+        with self.assertRaises(ValueError):
+            Gmail._parse_bodystructure([b'1 (UID 42 FLAGS (\\Seen))'])
+
+
+class FindExcelAttachmentTest(unittest.TestCase):
+    def test_finds_attachment_part_number(self):
+        self.assertEqual(
+            Gmail._find_excel_attachment(MULTIPART_FETCH),
+            ('2', 'base64', 'winners.xlsx')
+        )
+
+    def test_nested_multipart_part_number(self):
+        fetch_data = [
+            b'1 (BODYSTRUCTURE ((('
+            b'"text" "plain" ("charset" "utf-8") NIL NIL "7bit" 1 1 NIL NIL NIL NIL)('
+            b'"text" "html" ("charset" "utf-8") NIL NIL "7bit" 1 1 NIL NIL NIL NIL) "alternative" ("boundary" "a") NIL NIL NIL)('
+            b'"application" "vnd.ms-excel" ("name" "old.xls") NIL NIL "base64" 10 NIL ("attachment" NIL) NIL NIL) '
+            b'"mixed" ("boundary" "b") NIL NIL NIL))'
+        ]
+        self.assertEqual(Gmail._find_excel_attachment(fetch_data), ('2', 'base64', 'old.xls'))
+
+    def test_single_part_message(self):
+        fetch_data = [
+            b'1 (BODYSTRUCTURE ("application" "vnd.ms-excel" NIL NIL NIL "base64" 10 NIL '
+            b'("attachment" ("filename" "=?UTF-8?B?0L7RgtGH0LXRgi54bHN4?=")) NIL NIL))'
+        ]
+        self.assertEqual(Gmail._find_excel_attachment(fetch_data), ('1', 'base64', 'отчет.xlsx'))
+
+    def test_inline_and_non_excel_parts_are_skipped(self):
+        fetch_data = [
+            b'1 (BODYSTRUCTURE (('
+            b'"application" "vnd.ms-excel" ("name" "inline.xlsx") NIL NIL "base64" 10 NIL ("inline" NIL) NIL NIL)('
+            b'"application" "pdf" ("name" "doc.pdf") NIL NIL "base64" 10 NIL ("attachment" ("filename" "doc.pdf")) NIL NIL) '
+            b'"mixed" ("boundary" "b") NIL NIL NIL))'
+        ]
+        self.assertIsNone(Gmail._find_excel_attachment(fetch_data))
+
+
+class FakeImap:
+    """IMAP-соединение без сети: SELECT отдает заданный UIDVALIDITY, SEARCH - заданные UID"""
+    state = 'AUTH'
+
+    def __init__(self, uidvalidity: bytes, uids: bytes):
+        self._uidvalidity = uidvalidity
+        self._uids = uids
+        self.searches: list[str] = []
+
+    def noop(self):
+        return 'OK', [b'']
+
+    def select(self, mailbox):
+        self.state = 'SELECTED'
+        return 'OK', [b'2']
+
+    def response(self, code):
+        return code, [self._uidvalidity]
+
+    def uid(self, command, *args):
+        self.searches.append(args[-1])
+        return 'OK', [self._uids]
+
+
+class ImapStateTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state_file = Path(directory.name) / 'data' / 'imap_state.json'
+        patcher = mock.patch.object(settings, 'IMAP_STATE_FILE', self.state_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_gmail(self, imap: FakeImap) -> Gmail:
+        gmail = Gmail()
+        gmail.imap = imap
+        gmail.is_connected = True
+        return gmail
+
+    def test_processed_uid_survives_restart(self):
+        gmail = self.make_gmail(FakeImap(b'123', b'41 42'))
+        gmail._search_new_messages()
+        gmail.last_fetched_uid = 42
+        gmail.mark_processed()
+
+        self.assertEqual(json.loads(self.state_file.read_text()), {'uidvalidity': '123', 'last_processed_uid': 42})
+        imap = FakeImap(b'123', b'')
+        self.make_gmail(imap)._search_new_messages()
+        self.assertTrue(imap.searches[0].startswith('(UID 43:*'))
+
+    def test_uidvalidity_change_resets_processed_uid(self):
+        self.state_file.parent.mkdir()
+        self.state_file.write_text(json.dumps({'uidvalidity': '123', 'last_processed_uid': 42}))
+        imap = FakeImap(b'999', b'5 6')
+        gmail = self.make_gmail(imap)
+        self.assertEqual(gmail._last_processed_uid, 42)
+
+        with self.assertLogs('src.mail.mail_connector', level='WARNING'):
+            self.assertEqual(gmail._search_new_messages(), [5, 6])
+        self.assertIsNone(gmail._last_processed_uid)
+        self.assertEqual(gmail._uidvalidity, b'999')
+        self.assertNotIn('UID', imap.searches[0])
+
+    def test_unreadable_state_is_ignored(self):
+        self.state_file.parent.mkdir()
+        self.state_file.write_text('not json')
+        with self.assertLogs('src.mail.mail_connector', level='WARNING'):
+            gmail = Gmail()
+        self.assertIsNone(gmail._last_processed_uid)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import unittest
+
+from src.amo.rate_limit import TokenBucket
+
+
+class TokenBucketTest(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_up_to_capacity_is_immediate(self):
+        bucket = TokenBucket(rate=1, capacity=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+
+    async def test_waits_for_refill_when_empty(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        await bucket.acquire()
+        started = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    async def test_refill_is_capped_by_capacity(self):
+        bucket = TokenBucket(rate=1000, capacity=2)
+        await asyncio.sleep(0.02)
+        bucket._refill()
+        self.assertEqual(bucket._tokens, 2)
+
+    async def test_penalize_delays_next_acquire(self):
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.penalize(0.1)
+        started = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    async def test_repeated_penalize_keeps_single_pause(self):
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.penalize(0.1)
+        bucket.penalize(0.1)
+        bucket.penalize(0.05)
+        started = time.monotonic()
+        await bucket.acquire()
+        elapsed = time.monotonic() - started
+        self.assertGreaterEqual(elapsed, 0.1)
+        self.assertLess(elapsed, 0.18)
+
+    async def test_waiters_are_served_in_order(self):
+        bucket = TokenBucket(rate=50, capacity=1)
+        order = []
+
+        async def worker(number: int):
+            await bucket.acquire()
+            order.append(number)
+
+        await asyncio.gather(*(worker(i) for i in range(4)))
+        self.assertEqual(order, [0, 1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from src.amo.schemas import StatePurchase
+
+
+class ValidateNumbersToStrTest(unittest.TestCase):
+    def test_numbers_from_excel_cells(self):
+        purchase = StatePurchase(inn=7701234567.0, phone_1=79123456789)
+        self.assertEqual(purchase.inn, '7701234567')
+        self.assertEqual(purchase.phone_1, '79123456789')
+
+    def test_digit_strings_keep_leading_zeros(self):
+        self.assertEqual(StatePurchase(inn='0012345678').inn, '0012345678')
+
+    def test_strings_are_normalized_to_digits(self):
+        for value, expected in (
+            (' 7701234567 ', '7701234567'),
+            ('+7 (912) 345-67-89', '79123456789'),
+            ('7701234567.0', '7701234567'),
+        ):
+            with self.subTest(value=value):
+                self.assertEqual(StatePurchase(phone_1=value).phone_1, expected)
+
+    def test_strings_without_digits_become_none(self):
+        for value in ('нет', '-', '', '   '):
+            with self.subTest(value=value):
+                self.assertIsNone(StatePurchase(inn=value).inn)
+
+    def test_phones_skip_empty_values(self):
+        self.assertEqual(StatePurchase(phone_1='нет', phone_2='8 800 555-35-35').phones, ('88005553535',))
+
+
+if __name__ == '__main__':
+    unittest.main()